@@ -0,0 +1,142 @@
+# Elasticsearch 8.x 호환 가짜 서버 (ping / _search / _msearch)
+# - bench/fixtures.py 의 코퍼스를 메모리에 올려 BM25(토큰 겹침 수) / rescore / kNN 점수를 흉내낸다.
+# - elasticsearch-py 는 응답마다 X-Elastic-Product 헤더를 확인하므로 모든 응답에 붙인다.
+# - FAKE_ES_LATENCY_MS: 요청당 지연, BENCH_VECTOR_DIM: 벡터 차원 (인코더와 같아야 함)
+import asyncio
+import json
+import os
+from collections import defaultdict
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from bench.fixtures import build_corpus
+
+LATENCY = float(os.getenv("FAKE_ES_LATENCY_MS", "20")) / 1000
+DIM = int(os.getenv("BENCH_VECTOR_DIM", "768"))
+DOCS_PER_DOMAIN = int(os.getenv("BENCH_DOCS_PER_DOMAIN", "200"))
+
+CHUNKS, VECTORS, JUDGEMENTS = build_corpus(DOCS_PER_DOMAIN, dim=DIM)
+UNIT = VECTORS / np.linalg.norm(VECTORS, axis=1, keepdims=True)
+DOMAIN_OF = np.array([c["domain"] for c in CHUNKS])
+POSTINGS = defaultdict(list)  # 토큰 → chunk 행 번호
+for row, chunk in enumerate(CHUNKS):
+    for token in set(chunk["text"].split()):
+        POSTINGS[token].append(row)
+POSTINGS = {token: np.array(rows) for token, rows in POSTINGS.items()}
+
+HEADERS = {"X-Elastic-Product": "Elasticsearch"}
+app = FastAPI()
+
+
+def es_response(payload, status_code=200):
+    return JSONResponse(payload, status_code=status_code, headers=HEADERS)
+
+
+@app.api_route("/", methods=["GET", "HEAD"])
+async def info():
+    return es_response({
+        "name": "fake-es",
+        "cluster_name": "bench",
+        "version": {"number": "8.10.0", "build_flavor": "default"},
+        "tagline": "You Know, for Search",
+    })
+
+
+def _filters(query):
+    """bool.must 에서 domain term 과 match 텍스트를 꺼낸다."""
+    domain, text = None, ""
+    for clause in query.get("bool", {}).get("must", []):
+        if "term" in clause:
+            domain = clause["term"].get("domain")
+        if "match" in clause:
+            text = clause["match"].get("text", "")
+    return domain, text
+
+
+def _source(row, fields):
+    chunk = CHUNKS[row]
+    full = {"doc_id": chunk["doc_id"], "domain": chunk["domain"], "text": chunk["text"],
+            "sentences_vector": VECTORS[row].tolist()}
+    return full if fields is None else {f: full[f] for f in fields if f in full}
+
+
+def search_chunks(body):
+    size = body.get("size", 10)
+    fields = body.get("_source")
+
+    if "knn" in body:
+        knn = body["knn"]
+        query = np.asarray(knn["query_vector"], dtype=np.float32)
+        scores = (UNIT @ (query / np.linalg.norm(query)) + 1) / 2
+        domain = knn.get("filter", {}).get("term", {}).get("domain")
+        if domain:
+            scores = np.where(DOMAIN_OF == domain, scores, -np.inf)
+        rows = np.argsort(-scores)[:size]
+        rows = rows[np.isfinite(scores[rows])]
+    else:
+        domain, text = _filters(body.get("query", {}))
+        scores = np.zeros(len(CHUNKS), dtype=np.float32)
+        for token in text.split():
+            rows = POSTINGS.get(token)
+            if rows is not None:
+                scores[rows] += 1.0
+        if domain:
+            scores[DOMAIN_OF != domain] = 0
+        rescore = body.get("rescore")
+        window = rescore["window_size"] if rescore else size
+        rows = np.argsort(-scores)[:window]
+        rows = rows[scores[rows] > 0]
+        if rescore:
+            params = rescore["query"]["rescore_query"]["script_score"]["script"]["params"]
+            query = np.asarray(params["query_vector"], dtype=np.float32)
+            scores = scores.copy()
+            scores[rows] = UNIT[rows] @ (query / np.linalg.norm(query)) + 1.0
+            rows = rows[np.argsort(-scores[rows])]
+        rows = rows[:size]
+
+    hits = [
+        {"_index": "minsa_data", "_id": CHUNKS[row]["_id"], "_score": float(scores[row]),
+         "_source": _source(row, fields)}
+        for row in rows
+    ]
+    return {"took": 1, "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": None, "hits": hits}}
+
+
+def search_judgement(body):
+    doc_id = body.get("query", {}).get("term", {}).get("doc_id.keyword")
+    sentences = JUDGEMENTS.get(doc_id)
+    hits = [] if sentences is None else [
+        {"_index": "minsa_judgement", "_id": doc_id, "_score": 1.0, "_source": {"sentences": sentences}}
+    ]
+    return {"took": 1, "timed_out": False, "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+
+def run_search(index, body):
+    if index == "minsa_judgement":
+        return search_judgement(body)
+    return search_chunks(body)
+
+
+@app.post("/{index}/_search")
+async def search(index: str, request: Request):
+    body = json.loads(await request.body() or b"{}")
+    await asyncio.sleep(LATENCY)
+    return es_response(await asyncio.to_thread(run_search, index, body))
+
+
+@app.post("/_msearch")
+async def msearch(request: Request):
+    lines = [json.loads(line) for line in (await request.body()).decode("utf-8").splitlines() if line.strip()]
+    await asyncio.sleep(LATENCY)
+    responses = []
+    for header, body in zip(lines[0::2], lines[1::2]):
+        result = await asyncio.to_thread(run_search, header.get("index"), body)
+        result["status"] = 200
+        responses.append(result)
+    return es_response({"took": 1, "responses": responses})
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "HEAD", "DELETE"])
+async def unsupported(path: str):
+    return Response(status_code=404, headers=HEADERS)
@@ -0,0 +1,95 @@
+# OpenAI 호환 가짜 서버 (/v1/chat/completions, stream 지원)
+# - FAKE_LLM_LATENCY_MS: 첫 바이트까지의 지연
+# - FAKE_LLM_TOKEN_RATE: 스트리밍 초당 토큰 수
+# - FAKE_LLM_ANSWER_TOKENS: 답변 토큰 수
+# 프롬프트 종류(모드 분류 / 검색 요약 / 히스토리 요약 / 답변)에 따라 응답을 정하므로
+# 벤치마크 시나리오의 발화만으로 모드 전환을 재현할 수 있다.
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("FAKE_LLM_LATENCY_MS", "300")) / 1000
+TOKEN_RATE = float(os.getenv("FAKE_LLM_TOKEN_RATE", "50"))
+ANSWER_TOKENS = int(os.getenv("FAKE_LLM_ANSWER_TOKENS", "120"))
+
+ANSWER_WORDS = "일반적으로는 이런 경우 상대방에게 손해배상을 청구할 수 있습니다 관련 증거를 먼저 확보하세요".split()
+
+app = FastAPI()
+
+
+def classify(query: str):
+    """mode_classifier 프롬프트의 판정 기준을 키워드로 흉내"""
+    if "판례" in query or "사례" in query:
+        return "advising"
+    if "어떻게 해야" in query or "무엇을 하면" in query:
+        return "guidance"
+    if "당했" in query or "제가" in query:
+        return "info_gathering"
+    return "free_chat"
+
+
+def respond(prompt: str):
+    if "단계 판별" in prompt:
+        query = re.search(r'사용자 입력: "(.*)"', prompt)
+        mode = classify(query.group(1) if query else "")
+        return json.dumps({"next_mode": mode, "reason": "bench"}, ensure_ascii=False)
+    if "판결문 검색을 위해" in prompt:
+        query = re.search(r'사용자의 최신 발화: "(.*)"', prompt)
+        return query.group(1) if query else "손해배상 청구"
+    if "요약을 갱신" in prompt:
+        return "사용자는 분쟁 상황에 대해 상담 중이며 손해배상 가능성을 문의함"
+    return " ".join(ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(ANSWER_TOKENS))
+
+
+def tokens_of(text: str):
+    return re.findall(r"\S+\s*", text)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    text = respond(prompt)
+    model = body.get("model", "fake")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    await asyncio.sleep(LATENCY)
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 2, "completion_tokens": len(tokens_of(text)),
+                      "total_tokens": len(prompt) // 2 + len(tokens_of(text))},
+        })
+
+    def frame(delta, finish_reason=None):
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }, ensure_ascii=False) + "\n\n"
+
+    async def stream():
+        yield frame({"role": "assistant", "content": ""})
+        for token in tokens_of(text):
+            yield frame({"content": token})
+            await asyncio.sleep(1 / TOKEN_RATE)
+        yield frame({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
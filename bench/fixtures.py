@@ -0,0 +1,72 @@
+# 벤치마크용 고정 데이터
+# - minsa_data(chunk + 벡터) / minsa_judgement(원문) 코퍼스를 seed 로 결정적으로 생성한다.
+# - tb_ai_chat sqlite stand-in 에 DB 복원 경로를 타는 대화 기록을 넣는다.
+import os
+import sqlite3
+import numpy as np
+
+DOMAINS = ["교통사고", "부동산/임대차", "노동/고용", "의료사고", "채권/금전거래", "이혼/가족"]
+
+# 도메인별 어휘 (시나리오 질의와 겹치도록 구성해 BM25 가 실제로 후보를 찾게 한다)
+VOCAB = {
+    "교통사고": "교통사고 보행자 운전자 신호위반 횡단보도 과실비율 추돌 좌회전 과속 음주운전 보험사 치료비 합의금 손해배상 블랙박스",
+    "부동산/임대차": "임대인 임차인 보증금 월세 전세 계약해지 연체 명도 등기 확정일자 임대차계약 반환 수리비 중개사 갱신",
+    "노동/고용": "근로자 사용자 부당해고 임금체불 퇴직금 근로계약 수당 연장근로 산재 해고예고 노동위원회 복직 징계 최저임금 계약직",
+    "의료사고": "환자 의사 수술 오진 과실 후유증 설명의무 병원 진료기록 감정 치료 부작용 의료분쟁 손해배상 사망",
+    "채권/금전거래": "채권자 채무자 대여금 차용증 이자 변제 지급명령 보증인 가압류 강제집행 투자금 약정 연체 소멸시효 공증",
+    "이혼/가족": "배우자 이혼 재산분할 양육권 위자료 친권 협의이혼 재판상이혼 부정행위 혼인 양육비 면접교섭 상속 유언 가정폭력",
+}
+COMMON = "법원 판단 청구 인정 원고 피고 사건 책임 사실 증거 주장 판결 범위 경우 상대방"
+
+
+def build_corpus(docs_per_domain: int = 200, chunks_per_doc: int = 5, dim: int = 768, seed: int = 42):
+    """(chunks, vectors, judgements) 반환
+    - chunks: [{"_id", "doc_id", "domain", "text"}]
+    - vectors: (len(chunks), dim) float32
+    - judgements: doc_id → 문장 리스트
+    """
+    rng = np.random.default_rng(seed)
+    common = COMMON.split()
+    chunks, judgements = [], {}
+    for d, domain in enumerate(DOMAINS):
+        words = VOCAB[domain].split()
+        for i in range(docs_per_domain):
+            doc_id = f"{d:02d}-{i:05d}"
+            sentences = []
+            for c in range(chunks_per_doc):
+                picks = rng.choice(words, 8).tolist() + rng.choice(common, 6).tolist()
+                rng.shuffle(picks)
+                text = " ".join(picks)
+                chunks.append({"_id": f"{doc_id}-{c}", "doc_id": doc_id, "domain": domain, "text": text})
+                sentences.append(text + ".")
+            judgements[doc_id] = sentences * 8  # 원문은 chunk 보다 길게
+    vectors = rng.standard_normal((len(chunks), dim)).astype(np.float32)
+    return chunks, vectors, judgements
+
+
+def seed_chat_db(path: str, conversations: int = 50):
+    """DB 복원 시나리오용 대화 기록 (conv_idx = bench-restore-<n>)"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE tb_ai_chat (
+            idx INTEGER PRIMARY KEY AUTOINCREMENT,
+            conv_idx TEXT NOT NULL,
+            question TEXT,
+            answer TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX idx_tb_ai_chat_conv ON tb_ai_chat (conv_idx)")
+    rows = []
+    for n in range(conversations):
+        for turn in range(3):
+            rows.append((
+                f"bench-restore-{n}",
+                f"{turn + 1}번째 질문입니다. 임대인이 보증금 반환을 미루고 있어요.",
+                "일반적으로는 임대차계약 종료 후 보증금 반환을 청구할 수 있습니다. " * 4,
+            ))
+    conn.executemany("INSERT INTO tb_ai_chat (conv_idx, question, answer) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
@@ -0,0 +1,371 @@
+# /api/AIChat/stream 종단 간 부하 테스트
+# 가짜 OpenAI / 가짜 Elasticsearch / sqlite tb_ai_chat 를 띄우고 main:app 을 그 위에서 실행한 뒤,
+# 네 가지 모드를 모두 지나는 다중 턴 대화를 동시에 흘려 보내 처리량, TTFT 백분위, 단계별 지연, 메모리 증가를 잰다.
+#
+# 사용법:
+#   python -m bench.run --conversations 200 --concurrency 20
+#   python -m bench.run --baseline bench/results/<이전 결과>.json --fail-on-regression
+#
+# 앱 설정(SEARCH_RERANK_MODE, SSE_FLUSH_POLICY 등)과 가짜 서버 설정(FAKE_LLM_*, FAKE_ES_*)은 환경 변수로 넘긴다.
+# 결과는 bench/results/<시각>.json 에 저장되고, 앱 로그는 같은 이름의 .log 로 남는다.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+import httpx
+import numpy as np
+from prometheus_client.parser import text_string_to_metric_families
+from bench.fixtures import seed_chat_db
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+READY_TIMEOUT = 600  # 인코더 다운로드/로드 포함
+REGRESSION_TOLERANCE = 0.10
+
+# 시나리오: (가중치, 도메인, 발화 목록). 발화는 bench/fake_openai.py 의 분류 규칙에 맞춰 모드를 전환한다.
+# - consult : free_chat → info_gathering 2회 → advising
+# - precedent: free_chat 에서 바로 advising (투기적 검색 경로)
+# - guidance: free_chat → guidance → free_chat
+# - chat    : free_chat 만
+# - restore : DB 기록 복원 후 advising
+SCENARIOS = {
+    "consult": (3, "교통", [
+        "제가 어제 횡단보도에서 교통사고를 당했어요",
+        "좌회전 차량이 신호위반으로 보행자인 저를 추돌했어요",
+        "치료비와 합의금은 보험사와 이야기 중이에요",
+        "과실비율과 손해배상 범위가 궁금해요",
+    ]),
+    "precedent": (2, "노동", [
+        "부당해고 당한 근로자가 복직을 청구한 판례 있나요?",
+    ]),
+    "guidance": (2, "부동산", [
+        "임대인이 보증금 반환을 안 하면 어떻게 해야 하나요?",
+        "확정일자는 받아 두었어요",
+    ]),
+    "chat": (3, "의료", [
+        "의료사고에서 설명의무 위반은 무엇인가요?",
+        "진료기록 감정은 보통 얼마나 걸리나요?",
+    ]),
+    "restore": (1, "임대차", [
+        "이어서 비슷한 판례도 알려주세요",
+    ]),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(target: str, port: int, env: dict, log):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+         "--no-access-log", "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} 가 {timeout}초 안에 준비되지 않음")
+
+
+# ----------------------------------------------------------------------
+# 부하 생성
+# ----------------------------------------------------------------------
+
+async def run_turn(client, base, conv_idx, domain, query):
+    """한 턴 요청 → {mode, ttft, total, tokens, error}"""
+    start = time.perf_counter()
+    ttft, chars, error = None, 0, None
+    try:
+        async with client.stream("POST", f"{base}/api/AIChat/stream",
+                                 json={"query": query, "domain": domain, "conv_idx": conv_idx}) as response:
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+            async for line in response.aiter_lines():
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                event = json.loads(line[6:])
+                if "token" in event:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chars += len(event["token"])
+                elif "error" in event:
+                    error = event["error"]
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+    return {"ttft": ttft, "total": time.perf_counter() - start, "chars": chars, "error": error}
+
+
+async def run_conversation(client, base, name, restore_ids):
+    _, domain, turns = SCENARIOS[name]
+    conv_idx = restore_ids.pop() if name == "restore" and restore_ids else f"bench-{uuid.uuid4().hex[:12]}"
+    results = []
+    for query in turns:
+        result = await run_turn(client, base, conv_idx, domain, query)
+        result["scenario"] = name
+        results.append(result)
+    return results
+
+
+async def drive(base, conversations: int, concurrency: int, restore_ids, seed: int):
+    rng = random.Random(seed)
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[n][0] for n in names]
+    plan = rng.choices(names, weights, k=conversations)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), limits=limits) as client:
+        async def one(name):
+            async with semaphore:
+                return await run_conversation(client, base, name, restore_ids)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(name) for name in plan))
+        elapsed = time.perf_counter() - start
+    return [turn for conv in results for turn in conv], elapsed
+
+
+# ----------------------------------------------------------------------
+# /metrics 수집
+# ----------------------------------------------------------------------
+
+async def scrape(client, base):
+    text = (await client.get(f"{base}/metrics")).text
+    samples = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def stage_latency(before, after):
+    """hellaw_stage_seconds 히스토그램 차이 → stage 별 {count, mean_ms, p50_ms, p95_ms}"""
+    buckets = defaultdict(list)
+    sums, counts = {}, {}
+    for (name, labels), value in after.items():
+        labels = dict(labels)
+        delta = value - before.get((name, tuple(sorted(labels.items()))), 0.0)
+        if name == "hellaw_stage_seconds_bucket":
+            buckets[labels["stage"]].append((float(labels["le"]), delta))
+        elif name == "hellaw_stage_seconds_sum":
+            sums[labels["stage"]] = delta
+        elif name == "hellaw_stage_seconds_count":
+            counts[labels["stage"]] = delta
+
+    def quantile(bounds, q, total):
+        target, prev_bound, prev_count = q * total, 0.0, 0.0
+        for bound, count in sorted(bounds):
+            if count >= target:
+                if bound == float("inf"):
+                    return prev_bound
+                share = (target - prev_count) / ((count - prev_count) or 1)
+                return prev_bound + (bound - prev_bound) * share
+            prev_bound, prev_count = bound, count
+        return prev_bound
+
+    stages = {}
+    for stage, count in counts.items():
+        if count <= 0:
+            continue
+        stages[stage] = {
+            "count": int(count),
+            "mean_ms": round(sums[stage] / count * 1000, 2),
+            "p50_ms": round(quantile(buckets[stage], 0.50, count) * 1000, 2),
+            "p95_ms": round(quantile(buckets[stage], 0.95, count) * 1000, 2),
+        }
+    return stages
+
+
+async def sample_rss(client, base, peak: list, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            samples = await scrape(client, base)
+            peak[0] = max(peak[0], samples.get(("process_resident_memory_bytes", ()), 0.0))
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1.0)
+
+
+# ----------------------------------------------------------------------
+# 결과
+# ----------------------------------------------------------------------
+
+def percentiles(values):
+    if not values:
+        return None
+    arr = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 1),
+        "p95": round(float(np.percentile(arr, 95)), 1),
+        "p99": round(float(np.percentile(arr, 99)), 1),
+        "mean": round(float(arr.mean()), 1),
+    }
+
+
+def summarize(turns, elapsed, stages, rss):
+    ok = [t for t in turns if t["error"] is None]
+    by_scenario = {}
+    for name in SCENARIOS:
+        rows = [t for t in ok if t["scenario"] == name]
+        if rows:
+            by_scenario[name] = {
+                "turns": len(rows),
+                "ttft_ms": percentiles([t["ttft"] for t in rows if t["ttft"] is not None]),
+                "total_ms": percentiles([t["total"] for t in rows]),
+            }
+    return {
+        "turns": len(turns),
+        "errors": len(turns) - len(ok),
+        "error_samples": sorted({t["error"] for t in turns if t["error"]})[:5],
+        "elapsed_s": round(elapsed, 2),
+        "throughput": {
+            "turns_per_s": round(len(ok) / elapsed, 2),
+            "chars_per_s": round(sum(t["chars"] for t in ok) / elapsed, 1),
+        },
+        "ttft_ms": percentiles([t["ttft"] for t in ok if t["ttft"] is not None]),
+        "total_ms": percentiles([t["total"] for t in ok]),
+        "by_scenario": by_scenario,
+        "stages_ms": stages,
+        "memory": rss,
+    }
+
+
+def compare(result, baseline_path):
+    """기준 결과 대비 나빠진 지표 목록"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["summary"]
+    summary = result["summary"]
+    checks = [
+        ("throughput.turns_per_s", summary["throughput"]["turns_per_s"], baseline["throughput"]["turns_per_s"], False),
+        ("ttft_ms.p50", summary["ttft_ms"]["p50"], baseline["ttft_ms"]["p50"], True),
+        ("ttft_ms.p95", summary["ttft_ms"]["p95"], baseline["ttft_ms"]["p95"], True),
+        ("total_ms.p95", summary["total_ms"]["p95"], baseline["total_ms"]["p95"], True),
+        ("memory.growth_mb", summary["memory"]["growth_mb"], baseline["memory"]["growth_mb"], True),
+    ]
+    for stage, row in baseline.get("stages_ms", {}).items():
+        if stage in summary["stages_ms"]:
+            checks.append((f"stages_ms.{stage}.p95", summary["stages_ms"][stage]["p95_ms"], row["p95_ms"], True))
+
+    regressions = []
+    for name, value, base, lower_is_better in checks:
+        if base in (None, 0) or value is None:
+            continue
+        change = (value - base) / abs(base)
+        worse = change > REGRESSION_TOLERANCE if lower_is_better else change < -REGRESSION_TOLERANCE
+        print(f"  {name:<32} {base:>10} → {value:>10} ({change:+.1%}){'  ← 회귀' if worse else ''}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+async def main(args):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    log_path = os.path.join(RESULTS_DIR, f"{stamp}.log")
+    workdir = tempfile.mkdtemp(prefix="hellaw-bench-")
+    db_path = os.path.join(workdir, "hellaw.db")
+    seed_chat_db(db_path, args.restore_conversations)
+    restore_ids = [f"bench-restore-{n}" for n in range(args.restore_conversations)]
+
+    ports = {"openai": free_port(), "es": free_port(), "app": free_port()}
+    base = f"http://127.0.0.1:{ports['app']}"
+    env = dict(os.environ)
+    env.update({
+        "PYTHONUNBUFFERED": "1",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+        "ELASTIC_URL": f"http://127.0.0.1:{ports['es']}",
+        "ELASTIC_PASS": "bench",
+        "HELLAW_DB_BACKEND": "sqlite",
+        "HELLAW_DB_SQLITE_PATH": db_path,
+        "SESSION_STORE_PATH": os.path.join(workdir, "sessions.db"),
+    })
+
+    with open(log_path, "w", encoding="utf-8") as log:
+        servers = [
+            start_server("bench.fake_openai:app", ports["openai"], env, log),
+            start_server("bench.fake_es:app", ports["es"], env, log),
+            start_server("main:app", ports["app"], env, log),
+        ]
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                print("가짜 서버 및 앱 기동 대기...")
+                await wait_ready(client, f"{base}/ready")
+
+                if args.warmup:
+                    print(f"워밍업 대화 {args.warmup}개")
+                    await drive(base, args.warmup, args.concurrency, [], args.seed + 1)
+
+                before = await scrape(client, base)
+                peak, stop = [0.0], asyncio.Event()
+                sampler = asyncio.create_task(sample_rss(client, base, peak, stop))
+                print(f"대화 {args.conversations}개, 동시 {args.concurrency}개 실행 중...")
+                turns, elapsed = await drive(base, args.conversations, args.concurrency, restore_ids, args.seed)
+                stop.set()
+                await sampler
+                after = await scrape(client, base)
+        finally:
+            for server in servers:
+                server.terminate()
+            for server in servers:
+                server.wait(timeout=10)
+
+    rss_start = before.get(("process_resident_memory_bytes", ()), 0.0)
+    rss_end = after.get(("process_resident_memory_bytes", ()), 0.0)
+    rss = {
+        "start_mb": round(rss_start / 2**20, 1),
+        "end_mb": round(rss_end / 2**20, 1),
+        "peak_mb": round(max(peak[0], rss_end) / 2**20, 1),
+        "growth_mb": round((rss_end - rss_start) / 2**20, 1),
+    }
+    result = {
+        "timestamp": stamp,
+        "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip(),
+        "args": vars(args),
+        "env": {k: v for k, v in os.environ.items()
+                if k.startswith(("SEARCH_", "SSE_", "LLM_", "EMBED_", "ENCODER_", "SESSION_", "FAKE_", "BENCH_"))},
+        "summary": summarize(turns, elapsed, stage_latency(before, after), rss),
+    }
+
+    out_path = os.path.join(RESULTS_DIR, f"{stamp}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result["summary"], ensure_ascii=False, indent=2))
+    print(f"결과 저장: {out_path} (앱 로그: {log_path})")
+
+    if args.baseline:
+        print(f"기준 결과 비교: {args.baseline}")
+        regressions = compare(result, args.baseline)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hellaw AI 챗봇 종단 간 벤치마크")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5, help="측정 전에 흘려 보낼 대화 수")
+    parser.add_argument("--restore-conversations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", help="비교할 이전 결과 json")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -4,12 +4,149 @@ from dotenv import load_dotenv
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# 공용 LLM 게이트웨이: 요청 타임아웃(초), 커넥션 풀 크기, 재시도 횟수, 모델별 동시 호출 수
+# LLM_MODEL_CONCURRENCY 예) "gpt-4o-mini=64,gpt-4.1-mini=32" (없는 모델은 LLM_CONCURRENCY)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "100"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+LLM_MODEL_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split("=") for item in os.getenv("LLM_MODEL_CONCURRENCY", "").split(",") if "=" in item
+    )
+}
 
 ELASTIC_URL = os.getenv("ELASTIC_URL", "http://223.130.153.136:9201")
 ELASTIC_USER = os.getenv("ELASTIC_USER", "elastic")
 ELASTIC_PASS = os.getenv("ELASTIC_PASS")
+# 비동기 클라이언트 커넥션 풀 크기 및 요청 타임아웃(초)
+ELASTIC_POOL_SIZE = int(os.getenv("ELASTIC_POOL_SIZE", "32"))
+ELASTIC_TIMEOUT = float(os.getenv("ELASTIC_TIMEOUT", "10"))
+ELASTIC_SEARCH_TIMEOUT = float(os.getenv("ELASTIC_SEARCH_TIMEOUT", "5"))
+ELASTIC_FETCH_TIMEOUT = float(os.getenv("ELASTIC_FETCH_TIMEOUT", "3"))
 
 HELLAW_DB_HOST = os.getenv("HELLAW_DB_HOST", "localhost")
 HELLAW_DB_USER = os.getenv("HELLAW_DB_USER", "root")
 HELLAW_DB_PASSWORD = os.getenv("HELLAW_DB_PASSWORD", "")
 HELLAW_DB_NAME = os.getenv("HELLAW_DB_NAME", "hellaw")
+HELLAW_DB_PORT = int(os.getenv("HELLAW_DB_PORT", "3307"))
+# 대화 기록 DB: mysql(aiomysql 커넥션 풀) | sqlite(로컬 stand-in)
+HELLAW_DB_BACKEND = os.getenv("HELLAW_DB_BACKEND", "mysql")
+HELLAW_DB_SQLITE_PATH = os.getenv("HELLAW_DB_SQLITE_PATH", "hellaw.db")
+HELLAW_DB_POOL_MIN = int(os.getenv("HELLAW_DB_POOL_MIN", "1"))
+HELLAW_DB_POOL_MAX = int(os.getenv("HELLAW_DB_POOL_MAX", "10"))
+HELLAW_DB_TIMEOUT = float(os.getenv("HELLAW_DB_TIMEOUT", "3"))
+
+# 의미 기반 재정렬 위치: client(API 서버에서 NumPy) | rescore(ES script_score) | knn(ES kNN)
+#                        | local(로컬 mmap 벡터 인덱스, services/vector_index.py)
+SEARCH_RERANK_MODES = ("client", "rescore", "knn", "local")
+SEARCH_RERANK_MODE = os.getenv("SEARCH_RERANK_MODE", "client")
+if SEARCH_RERANK_MODE not in SEARCH_RERANK_MODES:
+    # 알 수 없는 값은 BM25 점수를 cosine 으로 취급하게 되므로 기동 시 바로 실패
+    raise ValueError(f"SEARCH_RERANK_MODE 는 {' | '.join(SEARCH_RERANK_MODES)} 중 하나여야 합니다: {SEARCH_RERANK_MODE!r}")
+# 재정렬 대상 BM25 후보 수 / ES 재정렬 모드에서 돌려받을 결과 수
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "500"))
+SEARCH_RESULT_SIZE = int(os.getenv("SEARCH_RESULT_SIZE", "50"))
+# client 모드 재정렬 시 chunk 별 정규화 벡터 캐시 크기
+SCORING_VECTOR_CACHE_SIZE = int(os.getenv("SCORING_VECTOR_CACHE_SIZE", "10000"))
+
+# 로컬 벡터 인덱스 (SEARCH_RERANK_MODE=local)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.getcwd(), "vector_index"))
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # float32 | int8
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+VECTOR_INDEX_TOP_K = int(os.getenv("VECTOR_INDEX_TOP_K", "100"))
+
+# 질의 임베딩 캐시 (EMBED_CACHE_PATH 를 주면 sqlite 디스크 계층 사용)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")
+
+# 임베딩 micro-batching (EMBED_BATCH_WINDOW_MS=0 이면 요청마다 바로 인코딩)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "16"))
+
+# 문장 인코더 추론 백엔드: torch | onnx | onnx-int8 (python -m services.model_loader export 로 생성)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_ONNX_DIR = os.getenv("ENCODER_ONNX_DIR", os.path.join(os.getcwd(), "onnx_model"))
+ENCODER_QUANT_CONFIG = os.getenv("ENCODER_QUANT_CONFIG", "avx2")
+# 기동 직후 백그라운드에서 인코더 로드 + 더미 encode (/ready 는 완료 후 준비 상태로 응답)
+ENCODER_WARMUP = os.getenv("ENCODER_WARMUP", "true").lower() == "true"
+
+# 판결문 원문 캐시 (바이트 기준, JUDGEMENT_CACHE_PATH 를 주면 sqlite 디스크 계층 사용)
+JUDGEMENT_CACHE_BYTES = int(os.getenv("JUDGEMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+JUDGEMENT_CACHE_TTL = float(os.getenv("JUDGEMENT_CACHE_TTL", "86400"))
+JUDGEMENT_CACHE_PATH = os.getenv("JUDGEMENT_CACHE_PATH", "")
+
+# free_chat 모드 분류 중 판례 검색을 미리 시작 (분류 결과가 advising 이 아니면 취소)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+
+# mode_classifier 로컬 분류기 (python -m services.local_classifier train 으로 생성)
+# 신뢰도가 임계값 이상이면 LLM 호출 없이 판정, MODE_LOG_PATH 를 주면 LLM 판정 결과를 학습용으로 기록
+# 임계값은 report 의 임계값별 일치율을 보고 정하며, 주지 않으면 로컬 분류기를 쓰지 않음
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", "")
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD")) if os.getenv("LOCAL_CLASSIFIER_THRESHOLD") else None
+MODE_LOG_PATH = os.getenv("MODE_LOG_PATH", "")
+
+# 세션 저장소 제한 (최대 세션 수, 유휴 TTL(초), 메시지 바이트 합계)
+SESSION_MAX = int(os.getenv("SESSION_MAX", "5000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+# 세션 공유 저장소: local(없음, 단일 워커) | memory(프로세스 내) | sqlite(같은 볼륨의 여러 워커, WAL)
+SESSION_STORE = os.getenv("SESSION_STORE", "local")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")
+
+# 프롬프트에 넣는 대화 히스토리 토큰 예산 (초과분은 백그라운드에서 누적 요약)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+# hybrid_search 결과 캐시 (키: 정규화된 검색 요약문, 도메인, k) — 동시에 같은 검색이 오면 한 번만 실행
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1000"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+
+# SSE 토큰 전송 정책: token(토큰마다) | ms(SSE_FLUSH_MS 간격) | bytes(SSE_FLUSH_BYTES 이상 모이면)
+SSE_FLUSH_POLICY = os.getenv("SSE_FLUSH_POLICY", "ms")
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "30"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "256"))
+# SSE 클라이언트 연결 끊김 확인 주기 (끊기면 진행 중인 LLM 스트림/검색을 취소)
+DISCONNECT_POLL_MS = float(os.getenv("DISCONNECT_POLL_MS", "250"))
+
+# 로그 레벨과 토큰 프레임 로그 샘플링 비율 (DEBUG 레벨에서만, 0~1)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+TOKEN_LOG_SAMPLE = float(os.getenv("TOKEN_LOG_SAMPLE", "0.01"))
+
+# free_chat 첫 턴 의미 기반 답변 캐시 (도메인 + 질의 임베딩 cosine 유사도가 임계값 이상이면 저장된 답변 재생)
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "false").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# 관리용 엔드포인트(DELETE /answer-cache) 토큰 (X-Admin-Token 헤더, 없으면 엔드포인트 비활성)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# 워커당 요청 수락 제한: 동시 처리 수, 대기열 길이, 대기 시간(초, 넘으면 503), 모드별 동시 처리 수
+# ADMISSION_MODE_LIMITS 예) "advising=16,guidance=32" (없는 모드는 전체 제한만 적용)
+# 같은 conv_idx 의 턴은 한 번에 하나씩 처리하며 CONV_LOCK_TIMEOUT 초 넘게 기다리면 429
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_MODE_LIMITS = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split("=") for item in os.getenv("ADMISSION_MODE_LIMITS", "advising=16").split(",") if "=" in item
+    )
+}
+CONV_LOCK_TIMEOUT = float(os.getenv("CONV_LOCK_TIMEOUT", "30"))
+
+# 판례 검색 마감 시간(초): 넘으면 판례 수를 줄이거나 판례 없이/일반 상담으로 답변
+# - RETRIEVAL_SUMMARY_TIMEOUT: 검색 요약 LLM 호출 상한 (넘으면 사용자 발화를 그대로 검색어로 사용)
+# - RETRIEVAL_FALLBACK_MIN   : 남은 시간이 이보다 짧으면 도메인 없는 재검색 생략
+RETRIEVAL_DEADLINE = float(os.getenv("RETRIEVAL_DEADLINE", "6"))
+RETRIEVAL_SUMMARY_TIMEOUT = float(os.getenv("RETRIEVAL_SUMMARY_TIMEOUT", "2.5"))
+RETRIEVAL_FALLBACK_MIN = float(os.getenv("RETRIEVAL_FALLBACK_MIN", "0.5"))
+# ES 요청 헤징: 최근 지연 시간의 ES_HEDGE_PERCENTILE 백분위(표본이 적으면 ES_HEDGE_DELAY 초)를 넘으면 같은 요청을 한 번 더 보냄
+ES_HEDGE = os.getenv("ES_HEDGE", "true").lower() == "true"
+ES_HEDGE_PERCENTILE = float(os.getenv("ES_HEDGE_PERCENTILE", "95"))
+ES_HEDGE_DELAY = float(os.getenv("ES_HEDGE_DELAY", "0.3"))
+# ES 서킷 브레이커: 연속 실패 ES_BREAKER_FAILURES 회면 ES_BREAKER_RESET 초 동안 ES 호출 없이 바로 실패
+ES_BREAKER_FAILURES = int(os.getenv("ES_BREAKER_FAILURES", "5"))
+ES_BREAKER_RESET = float(os.getenv("ES_BREAKER_RESET", "30"))
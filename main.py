@@ -1,9 +1,64 @@
-from fastapi import FastAPI
+import asyncio
+import hmac
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 import uvicorn
-from routers.chat_pipeline import router
+from config import ENCODER_WARMUP, LOG_LEVEL, ADMIN_TOKEN
+from routers.chat_pipeline import router, memory
+from services.es_client import close_es
+from services.llm_gateway import close_llm
+from services.chat_db import init_db, close_db
+from services.warmup import warm_up, readiness
+from services.history_manager import load_encoding
+from services.metrics import register_stats, render_metrics
+from services.embedding import embedding_cache_stats, embedding_batch_stats
+from services.searching import judgement_cache_stats, retrieval_cache_stats
+from services.speculation import speculation_stats
+from services.local_classifier import classifier_stats
+from services.disconnect import disconnect_stats
+from services.sse_writer import sse_stats
+from services.answer_cache import answer_cache, cache_domain
+from services.admission import admission
+from services.resilience import resilience_summary
 
-app = FastAPI(title="Hellaw AI Chatbot", version="1.0.0")
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+# /metrics 에 함께 내보낼 모듈별 통계
+register_stats("sessions", memory.stats)
+register_stats("embedding_cache", embedding_cache_stats)
+register_stats("embedding_batch", embedding_batch_stats)
+register_stats("judgement_cache", judgement_cache_stats)
+register_stats("retrieval_cache", retrieval_cache_stats)
+register_stats("speculation", lambda: speculation_stats)
+register_stats("classifier", lambda: classifier_stats)
+register_stats("disconnect", lambda: disconnect_stats)
+register_stats("sse", lambda: sse_stats)
+register_stats("answer_cache", answer_cache.stats)
+register_stats("admission", admission.stats)
+register_stats("resilience", resilience_summary)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    # 모델 로드는 기동을 막지 않도록 백그라운드에서 진행
+    warmup_task = asyncio.create_task(warm_up()) if ENCODER_WARMUP else None
+    # 히스토리 토큰 계산용 tiktoken 인코딩도 이벤트 루프 밖에서 로드 (그 전에는 글자 수로 추정)
+    encoding_task = asyncio.create_task(asyncio.to_thread(load_encoding))
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    encoding_task.cancel()
+    # 종료 시 공유 커넥션 풀 정리
+    await close_es()
+    await close_llm()
+    await close_db()
+    await memory.close()
+
+app = FastAPI(title="Hellaw AI Chatbot", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +75,29 @@ app.include_router(router, prefix="/api")
 async def root():
     return {"message": "FASTAPI 정상 작동"}
 
+@app.get("/ready")
+async def ready():
+    """인코더와 ES 연결이 준비됐을 때만 200"""
+    state = await readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 스크레이프 엔드포인트"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+@app.delete("/answer-cache")
+async def invalidate_answer_cache(domain: str = None, x_admin_token: str = Header(None)):
+    """의미 기반 답변 캐시 무효화 (domain 이 없으면 전체, ADMIN_TOKEN 필요)
+    캐시는 워커 메모리에 있으므로 이 요청을 받은 워커만 비운다. 여러 워커를 띄웠다면 워커마다 호출하거나
+    ANSWER_CACHE_TTL 이 지나기를 기다려야 한다.
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    removed = answer_cache.invalidate(cache_domain(domain) if domain else None)
+    return {"domain": domain, "removed": removed, "scope": "worker"}
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -1,87 +1,32 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response
 from models.models import ChatRequest
 from services.memory_manager import MemoryManager
 from services.mode_classifier import mode_classifier
+from services.speculation import maybe_speculate
 from services.chat_agent import (
     free_chat_agent,
     info_gathering_agent,
     advising_agent,
     guidance_agent
 )
-import os, uuid, json
-import pymysql
+from services.chat_db import load_conversation
+from services.answer_cache import cached_answer_stream
+from services.disconnect import DisconnectGuard, ClientDisconnected
+from services.admission import admission, AdmissionRejected
+from services.metrics import RequestTrace, span, log_frame
+from services.searching import DOMAIN_MAP
+from config import ANSWER_CACHE
+import asyncio, uuid
 from fastapi.responses import StreamingResponse
-from openai import AsyncOpenAI
 
 
-from config import (
-    HELLAW_DB_HOST,
-    HELLAW_DB_USER,
-    HELLAW_DB_PASSWORD,
-    HELLAW_DB_NAME
-)
-
 router = APIRouter(prefix="/AIChat", tags=["AIChat"])
 memory = MemoryManager()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 SPRING_API_URL = "http://localhost:8087/hellaw/api/AIChat"
-
-def get_chat_history_from_db(conv_idx: str):
-    conn = pymysql.connect(
-        host=HELLAW_DB_HOST,
-        user=HELLAW_DB_USER,
-        password=HELLAW_DB_PASSWORD,
-        database=HELLAW_DB_NAME,
-        port=3307,
-        cursorclass=pymysql.cursors.DictCursor,
-    )
-    with conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT question, answer
-                FROM tb_ai_chat
-                WHERE conv_idx = %s
-                ORDER BY created_at ASC
-            """,
-            (conv_idx,),
-            )
-            return cursor.fetchall()
-
-def db_has_conv(conv_idx):
-    conn = pymysql.connect(
-        host=HELLAW_DB_HOST,
-        user=HELLAW_DB_USER,
-        password=HELLAW_DB_PASSWORD,
-        database=HELLAW_DB_NAME,
-        port=3307,
-        cursorclass=pymysql.cursors.DictCursor
-    )
-    with conn:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT 1 FROM tb_ai_chat WHERE conv_idx = %s LIMIT 1", (conv_idx,))
-            return cursor.fetchone() is not None
-
-def restore_memory_from_db(conv_idx: str, db_records):
-    memory_context = memory.get_memory(conv_idx)
-    for row in db_records:
-        if row.get("question"):
-            memory_context.chat_memory.add_message(
-                {
-                    "role": "user",
-                    "content": row["question"]
-                }
-            )
-        if row.get("answer"):
-            memory_context.chat_memory.add_message(
-                {
-                    "role": "ai",
-                    "content": row["answer"]
-                }
-            )
-
+_closing = set()  # 마무리 중인 턴 (GC 방지용 참조)
 
 @router.post("/stream", response_class=StreamingResponse)
-async def chat_pipeline(request: ChatRequest):
+async def chat_pipeline(request: ChatRequest, http_request: Request):
 
     # 변수 설정
     conv_idx = request.conv_idx or f"stream_{uuid.uuid4()}"
@@ -93,40 +38,139 @@ async def chat_pipeline(request: ChatRequest):
     print(f"domain : {domain}")
     print(f"conv_idx : {conv_idx}")
 
+    # 단계별 소요 시간 계측 (알 수 없는 도메인은 라벨 수가 늘지 않도록 other 로 집계)
+    trace = RequestTrace(conv_idx, domain if domain in DOMAIN_MAP else "other")
+
+    # 동시 처리 수 제한 + 같은 conv_idx 의 턴 직렬화 (대기열이 가득 차거나 오래 기다리면 429/503 으로 거절)
+    try:
+        ticket = await admission.admit(conv_idx)
+    except AdmissionRejected as e:
+        print(f"[{conv_idx}] 요청 거절 ({e.status} {e.reason})")
+        trace.finish("rejected")
+        return e.response()
+
+    try:
+        return await _start_turn(request, http_request, conv_idx, trace, ticket)
+    except BaseException:
+        ticket.release()
+        raise
+
+
+async def _start_turn(request: ChatRequest, http_request: Request, conv_idx, trace, ticket):
+    """모드 결정까지 처리하고 SSE 응답을 만든다. ticket 은 스트림이 끝날 때 반납"""
+    domain = request.domain
+    query = request.query
+
+    # 클라이언트 연결이 끊기면 진행 중인 LLM/검색 작업을 취소
+    # ticket 은 끊김 표시만 하고, 모드 결정까지는 이 핸들러가 await 마다 확인해 직접 반납한다.
+    guard = DisconnectGuard(http_request, conv_idx)
+    guard.on_disconnect(ticket.abandon)
+
+    async def close_turn(status, summarize=False):
+        """이번 턴 상태 저장 후 ticket 반납 / trace 기록 (저장이 실패해도 반납과 기록은 한다)"""
+        try:
+            await memory.end_turn(conv_idx, turn)
+            if summarize:
+                memory.schedule_summary(conv_idx)
+        finally:
+            ticket.release()
+            trace.finish(status)
+
+    async def finish_early(status, response, precedents_task=None):
+        """스트림 없이 턴 종료 (연결 끊김 / 모드 슬롯 거절)"""
+        if precedents_task is not None:
+            precedents_task.cancel()
+        guard.close()
+        await close_turn(status)
+        return response
+
+    # 공유 세션 저장소에서 최신 상태 동기화 (SESSION_STORE)
+    # turn 은 이번 턴의 세션으로, 턴 도중 LRU 에서 밀려나도 end_turn 까지 그대로 저장한다.
+    turn = await memory.begin_turn(conv_idx)
+    if guard.disconnected:
+        return await finish_early("disconnected", Response(status_code=499))
     memory_context = memory.get_memory(conv_idx)
 
-    if db_has_conv(conv_idx) and len(memory_context.chat_memory.messages) == 0:
-        db_records = get_chat_history_from_db(conv_idx)
-        restore_memory_from_db(conv_idx, db_records)
-        print(f"[{conv_idx}] DB 기반 메모리 복원 완료 ({len(db_records)}개 메시지)")
-    elif not db_has_conv(conv_idx):
-        print(f"[{conv_idx}] 신규 대화 시작")
-    else:
+    # 메모리가 비어 있을 때만 DB 를 한 번 조회 (conv_idx 를 새로 만든 경우는 조회하지 않음)
+    if len(memory_context.chat_memory.messages) > 0:
         print(f"[{conv_idx}] 기존 세션, DB 복원 생략")
+    else:
+        with span("db_restore"):
+            db_records = await load_conversation(conv_idx) if request.conv_idx else []
+        if guard.disconnected:
+            return await finish_early("disconnected", Response(status_code=499))
+        if db_records:
+            memory.restore(conv_idx, db_records)
+            print(f"[{conv_idx}] DB 기반 메모리 복원 완료 ({len(db_records)}개 메시지)")
+        else:
+            print(f"[{conv_idx}] 신규 대화 시작")
 
     memory_context = memory.get_memory(conv_idx)
     current_mode = memory.get_mode(conv_idx)
 
     print(f"[세션 : {conv_idx}] 현재 모드 : {current_mode}")
 
+    # 이전 대화가 없는 첫 턴인지 (의미 기반 답변 캐시는 맥락이 없는 질문에만 사용)
+    first_turn = len(memory_context.chat_memory.messages) == 0
+
     # 메모리 등록
     memory.add(conv_idx, "user", query)
     print(f"사용자 발화 등록 완료, 메모리 메시지 수: {len(memory_context.chat_memory.messages)}")
 
+    # 프롬프트에는 토큰 예산을 적용한 히스토리(최근 턴 원문 + 이전 턴 요약)를 넘김
+    history = memory.get_history(conv_idx)
+
     # free_chat일 때 mode 판단
+    # 조언 요청으로 보이면 분류와 동시에 판례 검색을 미리 시작 (SPECULATIVE_RETRIEVAL)
+    precedents_task = None
     if current_mode == "free_chat":
         print("모드 분류 중...")
-        mode_classification = await mode_classifier(query, memory_context, domain)
+        speculation = maybe_speculate(history, query, domain)
+        try:
+            with span("classify"):
+                mode_classification = await guard.run(mode_classifier(query, history, domain), "classify")
+        except ClientDisconnected:
+            # 분류 중 연결이 끊기면 응답을 만들지 않고 종료
+            return await finish_early("disconnected", Response(status_code=499), speculation)
+        except BaseException:
+            if speculation is not None:
+                speculation.cancel()
+            raise
         next_mode = mode_classification.get("next_mode", "free_chat")
         reason = mode_classification.get("reason", "")
         memory.set_mode(conv_idx, next_mode)
         print(f"모드 전환 : {current_mode} -> {next_mode} 이유: {reason}")
         current_mode = next_mode
+
+        if speculation is not None:
+            if next_mode == "advising":
+                precedents_task = guard.track(speculation.claim())
+            else:
+                speculation.cancel()
+                print("[SPECULATIVE] advising 아님 → 미리 시작한 판례 검색 취소")
     else:
         print(f"모드 유지 : {current_mode}")
-    
+    trace.mode = current_mode
+
+    # 모드별 동시 처리 수 제한 (advising 이 몰려도 다른 모드는 계속 처리)
+    # 슬롯을 기다리기 전후로 연결을 확인해, 끊긴 요청은 슬롯을 잡은 채 남지 않도록 바로 반납
+    if guard.disconnected:
+        return await finish_early("disconnected", Response(status_code=499), precedents_task)
+    try:
+        await admission.admit_mode(ticket, current_mode)
+    except AdmissionRejected as e:
+        print(f"[{conv_idx}] 요청 거절 ({e.status} {e.reason}, 모드: {current_mode})")
+        return await finish_early("rejected", e.response(), precedents_task)
+    if guard.disconnected:
+        return await finish_early("disconnected", Response(status_code=499), precedents_task)
+
     # SSE 이벤트 스트림
     async def event_stream():
+        if ticket.released:
+            return  # 스트림이 시작되기 전에 연결이 끊겨 ticket 이 이미 반납됨
+        ticket.streaming = True
+        trace.activate()
+        status = "ok"
         yield f"data: {{\"conv_idx\": \"{conv_idx}\"}}\n\n"
         print(f"[{conv_idx}] 스트리밍 시작 (모드: {current_mode})")
 
@@ -139,8 +183,9 @@ async def chat_pipeline(request: ChatRequest):
 
                 # 새 말풍선 시작 신호 (항상 별도 말풍선)
                 yield "data: {\"new_message\": true}\n\n"
-                async for chunk in info_gathering_agent(query, domain, memory_context):
-                    print(f"[INFO_GATHERING] 토큰: {chunk[:100]}")
+                async for chunk in guard.stream(info_gathering_agent(query, domain, history), current_mode):
+                    trace.first_token()
+                    log_frame(current_mode, conv_idx, chunk)
                     yield chunk
 
                 memory.increment_info_rounds(conv_idx)
@@ -155,30 +200,54 @@ async def chat_pipeline(request: ChatRequest):
 
 
             elif current_mode == "advising":
-                async for chunk in advising_agent(query, domain, memory_context):
-                    print(f"[ADVISING] 토큰: {chunk[:100]}")
+                async for chunk in guard.stream(advising_agent(query, domain, history, precedents_task), current_mode):
+                    trace.first_token()
+                    log_frame(current_mode, conv_idx, chunk)
                     yield chunk
                 # 조언 완료 후, 다음 라운드를 위해 info_rounds 초기화 및 모드 free_chat 유지/복귀
                 memory.reset_info_rounds(conv_idx)
 
             elif current_mode == "guidance":
-                async for chunk in guidance_agent(query, domain, memory_context):
-                    print(f"[GUIDANCE] 토큰: {chunk[:100]}")
+                async for chunk in guard.stream(guidance_agent(query, domain, history), current_mode):
+                    trace.first_token()
+                    log_frame(current_mode, conv_idx, chunk)
                     yield chunk
                 memory.set_mode(conv_idx, "free_chat")
                 print(f"[{conv_idx}] guidance 종료 → free_chat 모드로 복귀")
 
             else:  # free_chat
-                async for chunk in free_chat_agent(query, domain, memory_context):
-                    print(f"[FREE_CHAT] 토큰: {chunk[:100]}")
+                agent = free_chat_agent(query, domain, history)
+                if ANSWER_CACHE and first_turn:
+                    agent = cached_answer_stream(query, domain, agent)
+                async for chunk in guard.stream(agent, current_mode):
+                    trace.first_token()
+                    log_frame(current_mode, conv_idx, chunk)
                     yield chunk
-    
+
+        except ClientDisconnected:
+            # 받을 사람이 없으므로 더 보내지 않음 (LLM 스트림/판례 검색은 guard 가 취소)
+            status = "disconnected"
+            return
+        except asyncio.CancelledError:
+            # 연결이 끊겨 Starlette 가 스트림을 취소함
+            status = "disconnected"
+            raise
         except Exception as e:
+            status = "error"
             print(f"스트림 처리 중 예외 발생 : {type(e).__name__} - {e}")
             yield f"data: {{\"error\": \"{str(e)}\"}}\n\n"
+        finally:
+            guard.close()
+            # 이번 턴 상태를 공유 저장소에 저장하고, 백그라운드에서 오래된 턴을 요약에 반영
+            # 취소된 스트림은 await 마다 CancelledError 가 다시 나므로, 저장과 ticket 반납은 별도 task 에서 끝까지 실행
+            closing = asyncio.ensure_future(close_turn(status, summarize=True))
+            _closing.add(closing)
+            closing.add_done_callback(_closing.discard)
+            await asyncio.shield(closing)
         
         print(f"[{conv_idx}] 스트리밍 완료")
         yield "data: [DONE]\n\n"
 
-    # FastAPI SSE 응답
+    # FastAPI SSE 응답 (이제 ticket 은 스트림 generator 가 소유)
+    ticket.handed_off = True
     return StreamingResponse(event_stream(), media_type="text/event-stream")
\ No newline at end of file
@@ -0,0 +1,191 @@
+# 요청 수락 제어 (워커 단위)
+# - 같은 conv_idx 의 턴은 conv lock 으로 직렬화 (MemoryManager 의 mode / info_rounds / 히스토리 동시 변경 방지)
+# - 전체 동시 처리 수 제한 + 길이 제한 대기열: 대기열이 가득 차면 429, 대기 시간이 넘으면 503
+# - 모드별 동시 처리 수 제한: 무거운 advising 턴이 free_chat 을 굶기지 않도록
+#   (모드 슬롯을 기다리는 동안에는 전체 슬롯을 내놓는다)
+# 획득한 자원은 Ticket 하나에 모아 release() 로 한 번만 반납한다 (여러 경로에서 호출해도 안전).
+# 반납은 ticket 을 소유한 쪽이 한다: 모드 결정까지는 핸들러, 응답을 넘긴 뒤에는 스트림 generator.
+import asyncio
+from fastapi.responses import JSONResponse
+from config import (
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_MODE_LIMITS,
+    CONV_LOCK_TIMEOUT,
+)
+
+
+class AdmissionRejected(Exception):
+    """요청 거절 (status: 429 | 503, reason: 집계용 사유)"""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+    def response(self):
+        return JSONResponse({"error": "서버가 혼잡합니다. 잠시 후 다시 시도해주세요.", "reason": self.reason},
+                            status_code=self.status, headers={"Retry-After": "1"})
+
+
+class Ticket:
+    def __init__(self, controller, conv_idx):
+        self.controller = controller
+        self.conv_idx = conv_idx
+        self.mode = None
+        self.handed_off = False  # 핸들러가 스트림 응답을 넘겼는지 (이후 소유자는 스트림 generator)
+        self.streaming = False   # 응답 스트림이 시작됐는지 (시작 후에는 스트림 종료 시 반납)
+        self.abandoned = False   # 클라이언트 연결이 끊겼는지
+        self.holds_slot = True   # 전체 슬롯을 잡고 있는지 (모드 슬롯을 기다리는 동안은 내놓음)
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.controller._release(self)
+
+    def abandon(self):
+        """연결 끊김 표시 (DisconnectGuard 콜백)
+        - 핸들러나 스트림이 실행 중이면 표시만 하고, 반납은 그쪽에서 정리하며 한 번만 한다.
+        - 응답을 넘겼지만 스트림이 시작되지 않았으면 generator 가 실행되지 않으므로 여기서 반납한다.
+        """
+        self.abandoned = True
+        if self.handed_off and not self.streaming:
+            self.release()
+
+
+class AdmissionController:
+    def __init__(self, max_inflight: int = ADMISSION_MAX_INFLIGHT, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, mode_limits: dict = ADMISSION_MODE_LIMITS,
+                 conv_timeout: float = CONV_LOCK_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.conv_timeout = conv_timeout
+        self.slots = asyncio.Semaphore(max_inflight)
+        self.mode_slots = {mode: asyncio.Semaphore(limit) for mode, limit in mode_limits.items()}
+        self.conv_locks = {}  # conv_idx → [asyncio.Lock, 사용 중인 요청 수]
+        self.inflight = 0
+        self.waiting = 0
+        self.mode_inflight = {}
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "queue_timeout": 0, "conv_busy": 0, "mode_timeout": 0}
+
+    def _reject(self, status, reason):
+        self.shed[reason] += 1
+        return AdmissionRejected(status, reason)
+
+    async def _lock_conv(self, conv_idx):
+        entry = self.conv_locks.setdefault(conv_idx, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            await asyncio.wait_for(entry[0].acquire(), self.conv_timeout)
+        except BaseException:
+            self._unref_conv(conv_idx)
+            raise
+
+    def _unref_conv(self, conv_idx):
+        entry = self.conv_locks[conv_idx]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.conv_locks[conv_idx]
+
+    async def admit(self, conv_idx):
+        """conv lock → 전체 슬롯 순서로 획득 (같은 대화의 이전 턴을 기다리는 동안에는 슬롯을 잡지 않음)"""
+        try:
+            await self._lock_conv(conv_idx)
+        except asyncio.TimeoutError:
+            raise self._reject(429, "conv_busy")
+
+        try:
+            if self.slots.locked():
+                if self.waiting >= self.queue_size:
+                    raise self._reject(429, "queue_full")
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    raise self._reject(503, "queue_timeout")
+                finally:
+                    self.waiting -= 1
+            else:
+                await self.slots.acquire()
+        except BaseException:
+            self.conv_locks[conv_idx][0].release()
+            self._unref_conv(conv_idx)
+            raise
+
+        self.inflight += 1
+        self.admitted += 1
+        return Ticket(self, conv_idx)
+
+    async def admit_mode(self, ticket: Ticket, mode: str):
+        """모드가 정해진 뒤 모드별 슬롯 획득 (제한이 없는 모드는 바로 통과)
+        모드 슬롯을 기다리는 동안에는 전체 슬롯을 내놓아, 대기 중인 advising 턴이 다른 모드의 자리를 막지 않게 한다.
+        """
+        slots = self.mode_slots.get(mode)
+        if slots is not None:
+            if slots.locked():
+                self._release_slot(ticket)
+            try:
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject(503, "mode_timeout")
+        if ticket.released:
+            # 기다리는 사이 ticket 이 반납됐으면 잡은 모드 슬롯도 바로 돌려준다
+            if slots is not None:
+                slots.release()
+            return
+        if not ticket.holds_slot:
+            try:
+                await self._acquire_slot(ticket)
+            except BaseException:
+                slots.release()
+                raise
+        ticket.mode = mode
+        self.mode_inflight[mode] = self.mode_inflight.get(mode, 0) + 1
+
+    async def _acquire_slot(self, ticket: Ticket):
+        """모드 슬롯을 기다리며 내놓았던 전체 슬롯을 다시 획득 (이미 수락된 요청이므로 대기열 길이 제한 없음)"""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(503, "queue_timeout")
+        finally:
+            self.waiting -= 1
+        ticket.holds_slot = True
+        self.inflight += 1
+
+    def _release_slot(self, ticket: Ticket):
+        if ticket.holds_slot:
+            ticket.holds_slot = False
+            self.inflight -= 1
+            self.slots.release()
+
+    def _release(self, ticket: Ticket):
+        if ticket.mode is not None:
+            self.mode_inflight[ticket.mode] -= 1
+            slots = self.mode_slots.get(ticket.mode)
+            if slots is not None:
+                slots.release()
+        self._release_slot(ticket)
+        self.conv_locks[ticket.conv_idx][0].release()
+        self._unref_conv(ticket.conv_idx)
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queue_depth": self.waiting,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "mode_inflight": dict(self.mode_inflight),
+            "conversations_locked": len(self.conv_locks),
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,151 @@
+# free_chat 첫 턴 의미 기반 답변 캐시 (ANSWER_CACHE)
+# 같은 도메인에서 표현만 조금 다른 일반 질문이 반복되므로, 대화 맥락이 없는 첫 턴에 한해
+# (도메인, SimCSE 질의 임베딩) 으로 이전 답변을 찾아 SSE token/full/[DONE] 프레임으로 재생한다.
+# - 도메인별로 unit 벡터를 하나의 행렬로 모아 두고 행렬-벡터 곱 한 번으로 최근접 답변을 찾는다.
+# - 전체 항목 수(LRU)와 TTL 로 제한하고(만료 항목은 조회 시 도메인 단위로 정리), 도메인 단위로 무효화할 수 있다.
+# - 캐시는 워커 메모리에 있으므로 무효화도 워커 단위다.
+import json
+import time
+from collections import OrderedDict
+import numpy as np
+from config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL
+from .embedding import encode_query
+from .searching import DOMAIN_MAP
+from .sse_writer import sse_event
+
+# 재생 시 token 프레임 하나에 담는 글자 수
+REPLAY_CHUNK_CHARS = 64
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_SIZE,
+                 ttl: float = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (domain, id) → (query, answer, created) (오래 사용하지 않은 순)
+        self.domains = {}             # domain → {"ids": [...], "matrix": (n, dim) unit 벡터}
+        self.next_id = 0
+        self.counts = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def _remove(self, domain, entry_id):
+        del self.entries[(domain, entry_id)]
+        index = self.domains[domain]
+        keep = [i for i, eid in enumerate(index["ids"]) if eid != entry_id]
+        index["ids"] = [index["ids"][i] for i in keep]
+        index["matrix"] = index["matrix"][keep]
+
+    def _purge_expired(self, domain):
+        """도메인에서 TTL 이 지난 항목을 한 번에 삭제"""
+        index = self.domains[domain]
+        now = time.monotonic()
+        keep = [i for i, eid in enumerate(index["ids"]) if now - self.entries[(domain, eid)][2] <= self.ttl]
+        if len(keep) == len(index["ids"]):
+            return
+        keep_ids = {index["ids"][i] for i in keep}
+        for entry_id in index["ids"]:
+            if entry_id not in keep_ids:
+                del self.entries[(domain, entry_id)]
+                self.counts["expired"] += 1
+        index["ids"] = [index["ids"][i] for i in keep]
+        index["matrix"] = index["matrix"][keep]
+
+    def lookup(self, domain: str, vector):
+        """유사도가 임계값 이상인 답변 (answer, similarity), 없으면 None"""
+        if domain in self.domains:
+            self._purge_expired(domain)
+        index = self.domains.get(domain)
+        if index is None or not index["ids"]:
+            self.counts["misses"] += 1
+            return None
+
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = index["matrix"] @ query
+        best = int(np.argmax(scores))
+        entry_id, similarity = index["ids"][best], float(scores[best])
+        if similarity < self.threshold:
+            self.counts["misses"] += 1
+            return None
+
+        _, answer, _ = self.entries[(domain, entry_id)]
+        self.entries.move_to_end((domain, entry_id))
+        self.counts["hits"] += 1
+        return answer, similarity
+
+    def store(self, domain: str, query: str, vector, answer: str):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        entry_id, self.next_id = self.next_id, self.next_id + 1
+        self.entries[(domain, entry_id)] = (query, answer, time.monotonic())
+        index = self.domains.setdefault(domain, {"ids": [], "matrix": np.empty((0, len(vector)), np.float32)})
+        index["ids"].append(entry_id)
+        index["matrix"] = np.vstack([index["matrix"], vector])
+        self.counts["stores"] += 1
+        while len(self.entries) > self.max_entries:
+            old_domain, old_id = next(iter(self.entries))
+            self._remove(old_domain, old_id)
+            self.counts["evictions"] += 1
+
+    def invalidate(self, domain: str = None):
+        """도메인(없으면 전체)의 캐시 항목 삭제. 삭제한 항목 수 반환"""
+        targets = [domain] if domain is not None else list(self.domains)
+        removed = 0
+        for name in targets:
+            index = self.domains.pop(name, None)
+            if index is None:
+                continue
+            for entry_id in index["ids"]:
+                del self.entries[(name, entry_id)]
+            removed += len(index["ids"])
+        self.counts["invalidations"] += 1
+        return removed
+
+    def stats(self):
+        lookups = self.counts["hits"] + self.counts["misses"]
+        return {
+            **self.counts,
+            "entries": len(self.entries),
+            "hit_rate": round(self.counts["hits"] / lookups, 4) if lookups else None,
+        }
+
+
+answer_cache = AnswerCache()
+
+
+def cache_domain(domain: str):
+    """UI 도메인 키워드를 인덱스 도메인으로 정규화 (교통 / 교통사고 가 같은 캐시를 사용)"""
+    return DOMAIN_MAP.get(domain, domain)
+
+
+def replay_frames(answer: str):
+    """저장된 답변을 stream_response 와 같은 프레임 순서로 재생"""
+    for start in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield sse_event({"token": answer[start:start + REPLAY_CHUNK_CHARS]})
+    yield sse_event({"full": answer})
+    yield "data: [DONE]\n\n"
+
+
+async def cached_answer_stream(query: str, domain: str, agent):
+    """캐시에 비슷한 질문의 답변이 있으면 재생하고, 없으면 agent 스트림을 그대로 전달한 뒤 답변을 저장"""
+    domain = cache_domain(domain)
+    vector = await encode_query(query)
+    hit = answer_cache.lookup(domain, vector)
+    if hit is not None:
+        answer, similarity = hit
+        print(f"[ANSWER_CACHE] 캐시 답변 재생 (유사도 {similarity:.3f})")
+        await agent.aclose()
+        for frame in replay_frames(answer):
+            yield frame
+        return
+
+    full = None
+    try:
+        async for chunk in agent:
+            if chunk.startswith('data: {"full"'):
+                full = json.loads(chunk[len("data: "):])["full"]
+            yield chunk
+    finally:
+        await agent.aclose()
+    if full:
+        answer_cache.store(domain, query, vector, full)
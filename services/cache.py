@@ -0,0 +1,191 @@
+# 서비스 공통 캐시
+# - LRUCache   : 프로세스 메모리 LRU + TTL 캐시 (항목 수/바이트 제한, thread-safe, 적중/미스 통계)
+# - SqliteCache: 재시작 후에도 유지되는 sqlite 디스크 계층 (값은 bytes)
+# - SingleFlight: 같은 키로 동시에 들어온 비동기 작업을 하나로 합침
+import os, sys, time, sqlite3, threading, asyncio
+from collections import OrderedDict
+
+
+class LRUCache:
+    """항목 수 / 바이트 / TTL 로 제한되는 thread-safe LRU 캐시
+    - max_bytes 를 쓰면 sizeof(value) 로 항목 크기를 계산합니다. (기본 sys.getsizeof)
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, max_bytes: int = None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or sys.getsizeof
+        self._data = OrderedDict()  # key → (저장 시각, value, 크기)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, value, size = item
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return  # 한 항목이 전체 예산보다 크면 저장하지 않음
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (time.monotonic(), value, size)
+            self._bytes += size
+            while (self.max_entries and len(self._data) > self.max_entries) or (
+                self.max_bytes and self._bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self._bytes -= item[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SingleFlight:
+    """같은 키의 작업이 진행 중이면 새로 시작하지 않고 그 결과를 함께 기다린다.
+    - 기다리는 쪽 하나가 취소돼도 공유 작업은 계속되고, 모두 취소되면 공유 작업도 취소한다.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key → [task, 기다리는 수]
+        self.leaders = 0     # 실제로 실행한 작업 수
+        self.coalesced = 0   # 진행 중인 작업에 합류한 요청 수
+
+    async def do(self, key, fn):
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = [asyncio.ensure_future(fn()), 0]
+            self._inflight[key] = entry
+            entry[0].add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+class SqliteCache:
+    """sqlite 파일 기반 key → bytes 캐시 (TTL, 최대 항목 수)
+    - stored_at 은 마지막 저장/적중 시각이므로 TTL 과 정리 순서는 마지막 사용 기준입니다.
+    - 정리는 PRUNE_EVERY 번 저장할 때마다 한 번만 하므로 그 사이에는 max_entries 를 조금 넘을 수 있습니다.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, ttl: float = None, max_entries: int = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, stored_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            # 적중한 항목은 최근 사용으로 (LRU)
+            self._conn.execute("UPDATE cache SET stored_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), now),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            self._conn.commit()
+
+    def _prune(self, now):
+        """만료 항목과 max_entries 를 넘는 오래된 항목 삭제 (stored_at 인덱스 사용)"""
+        if self.ttl:
+            self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (now - self.ttl,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE stored_at < ("
+                " SELECT stored_at FROM cache ORDER BY stored_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries - 1,),
+            )
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"size": size, "hits": self.hits, "misses": self.misses}
@@ -1,33 +1,72 @@
 # services/agents/common_agents.py
-import json, asyncio
+import asyncio
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from .searching import (
-    summarize_context_for_search,
-    hybrid_search,
-    get_unique_docs,
-    fetch_full_text,
-)
+from config import LLM_MAX_RETRIES
+from .llm_gateway import get_client, llm_slot, on_close
+from .searching import retrieve_precedents, RetrievalUnavailable
+from .sse_writer import TokenWriter, sse_event
+
+_llms = {}  # (model, temperature) → ChatOpenAI
+on_close(_llms.clear)  # 닫힌 공용 클라이언트를 가리키는 인스턴스를 버림
 
 def get_llm(model="gpt-4.1-mini", temperature=0.5):
-    """공통 LLM 생성 함수"""
-    return ChatOpenAI(
-        model=model,
-        temperature=temperature,
-        streaming=True
-    )
-
-async def stream_response(chain, inputs, end_with_done: bool = True):
+    """공통 LLM 생성 함수 (게이트웨이의 공용 AsyncOpenAI 클라이언트를 사용하며, 인스턴스는 재사용)"""
+    key = (model, temperature)
+    if key not in _llms:
+        _llms[key] = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            streaming=True,
+            async_client=get_client().with_options(max_retries=LLM_MAX_RETRIES).chat.completions,
+        )
+    return _llms[key]
+
+async def stream_response(chain, inputs, end_with_done: bool = True, model: str = "gpt-4.1-mini"):
     """공통 스트리밍 처리
     - end_with_done=False 로 주면 마지막 [DONE]은 보내지 않습니다.
+    - 스트림이 끝날 때까지 model 의 동시 호출 슬롯을 점유합니다.
+    - 토큰은 SSE_FLUSH_POLICY 에 따라 여러 개를 한 프레임으로 묶어 보냅니다.
     """
-    accumulated = ""
-    async for chunk in chain.astream(inputs):
-        token = getattr(chunk, "content", str(chunk))
-        accumulated += token
-        yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
-        await asyncio.sleep(0.01)
-    yield f"data: {json.dumps({'full': accumulated}, ensure_ascii=False)}\n\n"
+    writer = TokenWriter()
+    stream = chain.astream(inputs).__aiter__()
+    next_chunk = None  # 보낼 토큰이 남아 있을 때 task 로 기다리는 다음 청크 (flush 간격이 지나면 먼저 flush)
+    async with llm_slot(model):
+        try:
+            while True:
+                timeout = writer.flush_timeout()
+                if timeout is not None or next_chunk is not None:
+                    if next_chunk is None:
+                        next_chunk = asyncio.ensure_future(stream.__anext__())
+                    done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+                    if not done:
+                        # 상류가 멈춰도 쌓인 토큰을 SSE_FLUSH_MS 안에 보냄
+                        frame = writer.flush()
+                        if frame:
+                            yield frame
+                        continue
+                    pending, next_chunk = next_chunk, None
+                    try:
+                        chunk = pending.result()
+                    except StopAsyncIteration:
+                        break
+                else:
+                    try:
+                        chunk = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                frame = writer.push(getattr(chunk, "content", str(chunk)))
+                if frame:
+                    yield frame
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+                await asyncio.wait({next_chunk})
+            await stream.aclose()
+    frame = writer.flush()
+    if frame:
+        yield frame
+    yield sse_event({"full": writer.full})
     if end_with_done:
         yield "data: [DONE]\n\n"
 
@@ -55,7 +94,7 @@ async def free_chat_agent(query: str, domain: str, memory_context):
         "query": query,
         "domain": domain,
         "history": history_vars.get("history", [])
-    }):
+    }, model=llm.model_name):
         yield chunk
 
 domain_checklists = {
@@ -133,11 +172,13 @@ async def info_gathering_agent(query: str, domain: str, memory_context):
     async for chunk in stream_response(chain, {
         "query": query,
         "history": history_vars.get("history", [])
-    }, end_with_done=True):
+    }, end_with_done=True, model=llm.model_name):
         yield chunk
 
-async def advising_agent(user_query: str, domain: str, memory_context:str):
-    """판례 기반 조언"""
+async def advising_agent(user_query: str, domain: str, memory_context:str, precedents_task=None):
+    """판례 기반 조언
+    - precedents_task: retrieve_precedents 를 미리 실행 중인 task (없으면 여기서 검색)
+    """
     llm = get_llm()
     
     prompt = ChatPromptTemplate.from_messages([
@@ -157,32 +198,23 @@ async def advising_agent(user_query: str, domain: str, memory_context:str):
         ("user", "{user_query}")
     ])
 
-    # 요약 문장 생성
-    summary = await summarize_context_for_search(memory_context, user_query)
-    print(f"검색 요약: {summary}")
-
-    # RAG 검색
-    results = await hybrid_search(summary, domain)
-    if not results:
-        yield f"data: {json.dumps({'token': '관련된 판례를 찾지 못했습니다.'}, ensure_ascii=False)}\n\n"
+    # 판례 검색 (파이프라인이 투기적으로 미리 시작한 검색이 있으면 그 결과를 사용)
+    # 마감 시간 안에 검색하지 못하면 판례 없이 일반 상담으로 답변
+    try:
+        if precedents_task is not None:
+            full_texts = await precedents_task
+        else:
+            full_texts = await retrieve_precedents(memory_context, user_query, domain)
+    except RetrievalUnavailable as e:
+        print(f"[ADVISING] 판례 검색 불가 ({e}) → 일반 상담으로 답변")
+        async for chunk in free_chat_agent(user_query, domain, memory_context):
+            yield chunk
+        return
+    if full_texts is None:
+        yield sse_event({"token": "관련된 판례를 찾지 못했습니다."})
         yield "data: [DONE]\n\n"
         return
 
-    # 중복 제거 후 상위 3개만 추출
-    unique_docs = get_unique_docs(results, top_n = 3)
-
-    # 판례 원문 가져오기
-    full_texts = []
-    
-    for doc, score in unique_docs: 
-        text = await fetch_full_text(doc["doc_id"])
-        if text:
-            full_texts.append({
-                "doc_id": doc["doc_id"],
-                "score": score,
-                "text": text[:1200]
-            })
-
     # 판례 텍스트 합치기
     law_data = "\n\n".join([
         f"[사례 {i+1}] ({d['score']})\n{d['text']}"
@@ -199,7 +231,7 @@ async def advising_agent(user_query: str, domain: str, memory_context:str):
         "law_data": law_data,
         "domain": domain,        
         "history": history_vars.get("history", [])
-    }):
+    }, model=llm.model_name):
         yield chunk
 
 async def guidance_agent(advice_text: str, domain: str, memory_context):
@@ -226,5 +258,5 @@ async def guidance_agent(advice_text: str, domain: str, memory_context):
         "advice_text": advice_text,
         "domain": domain,
         "history": history_vars.get("history", [])
-    }):
+    }, model=llm.model_name):
         yield chunk
\ No newline at end of file
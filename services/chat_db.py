@@ -0,0 +1,119 @@
+# 대화 기록(tb_ai_chat) DB 접근
+# - mysql : 앱 기동 시 만든 aiomysql 커넥션 풀을 공유 (요청마다 connect 하지 않음)
+# - sqlite: 로컬 테스트/벤치마크용 stand-in (HELLAW_DB_BACKEND=sqlite)
+import asyncio, sqlite3, threading
+from config import (
+    HELLAW_DB_BACKEND,
+    HELLAW_DB_HOST,
+    HELLAW_DB_PORT,
+    HELLAW_DB_USER,
+    HELLAW_DB_PASSWORD,
+    HELLAW_DB_NAME,
+    HELLAW_DB_SQLITE_PATH,
+    HELLAW_DB_POOL_MIN,
+    HELLAW_DB_POOL_MAX,
+    HELLAW_DB_TIMEOUT,
+)
+
+HISTORY_SQL = """
+    SELECT question, answer
+    FROM tb_ai_chat
+    WHERE conv_idx = {param}
+    ORDER BY created_at ASC
+"""
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tb_ai_chat (
+        idx INTEGER PRIMARY KEY AUTOINCREMENT,
+        conv_idx TEXT NOT NULL,
+        question TEXT,
+        answer TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+_pool = None  # aiomysql 커넥션 풀
+_pool_lock = None
+_sqlite = None  # sqlite 커넥션 (스레드 간 공유, lock 으로 직렬화)
+_sqlite_lock = threading.Lock()
+
+
+async def _get_pool():
+    """커넥션 풀이 없으면 생성 (기동 시 DB 가 내려가 있었던 경우 첫 요청에서 재시도)"""
+    global _pool, _pool_lock
+    if _pool is None:
+        import aiomysql
+
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aiomysql.create_pool(
+                    host=HELLAW_DB_HOST,
+                    port=HELLAW_DB_PORT,
+                    user=HELLAW_DB_USER,
+                    password=HELLAW_DB_PASSWORD,
+                    db=HELLAW_DB_NAME,
+                    minsize=HELLAW_DB_POOL_MIN,
+                    maxsize=HELLAW_DB_POOL_MAX,
+                    connect_timeout=HELLAW_DB_TIMEOUT,
+                    pool_recycle=3600,
+                    autocommit=True,
+                    charset="utf8mb4",
+                    cursorclass=aiomysql.DictCursor,
+                )
+    return _pool
+
+
+def _get_sqlite():
+    global _sqlite
+    if _sqlite is None:
+        _sqlite = sqlite3.connect(HELLAW_DB_SQLITE_PATH, check_same_thread=False)
+        _sqlite.row_factory = sqlite3.Row
+        _sqlite.execute(SQLITE_SCHEMA)
+        _sqlite.commit()
+    return _sqlite
+
+
+async def init_db():
+    """앱 기동 시 커넥션 풀 생성. 실패해도 기동은 계속하고 첫 요청에서 다시 시도한다."""
+    try:
+        if HELLAW_DB_BACKEND == "sqlite":
+            await asyncio.to_thread(_get_sqlite)
+        else:
+            await _get_pool()
+        print(f"[DB] {HELLAW_DB_BACKEND} 연결 준비 완료")
+    except Exception as e:
+        print(f"[DB] 연결 실패 : {type(e).__name__} - {e}")
+
+
+async def close_db():
+    global _pool, _sqlite
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+    if _sqlite is not None:
+        _sqlite.close()
+        _sqlite = None
+
+
+async def _fetch_mysql(conv_idx: str):
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(HISTORY_SQL.format(param="%s"), (conv_idx,))
+            return list(await cursor.fetchall())
+
+
+def _fetch_sqlite(conv_idx: str):
+    with _sqlite_lock:
+        rows = _get_sqlite().execute(HISTORY_SQL.format(param="?"), (conv_idx,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+async def load_conversation(conv_idx: str):
+    """대화 기록을 한 번의 쿼리로 조회. 빈 리스트면 DB 에 없는 대화"""
+    if HELLAW_DB_BACKEND == "sqlite":
+        return await asyncio.wait_for(asyncio.to_thread(_fetch_sqlite, conv_idx), HELLAW_DB_TIMEOUT)
+    return await asyncio.wait_for(_fetch_mysql(conv_idx), HELLAW_DB_TIMEOUT)
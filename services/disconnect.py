@@ -0,0 +1,121 @@
+# SSE 클라이언트 연결 끊김 감지 및 진행 중 작업 취소
+# - 요청마다 DisconnectGuard 하나가 Request.is_disconnected() 를 주기적으로 확인한다.
+# - 끊기면 run()/stream() 으로 감싼 작업(모드 분류, 에이전트 스트림)과 track() 한 task(판례 검색)를 취소한다.
+# - 취소는 async with llm_slot(...) 블록을 빠져나가므로 동시 호출 슬롯도 바로 반납된다.
+# - 응답 전송이 먼저 실패해 스트림이 yield 에서 멈춰 있으면 에이전트 generator 를 닫아 OpenAI 스트림을 정리한다.
+import asyncio
+from config import DISCONNECT_POLL_MS
+
+# - disconnects    : 처리 도중 연결이 끊긴 요청 수
+# - stages         : 끊긴 시점의 단계별 횟수 (classify / free_chat / advising ...)
+# - tasks_cancelled: 취소한 백그라운드 task 수 (판례 검색 등)
+disconnect_stats = {"disconnects": 0, "stages": {}, "tasks_cancelled": 0}
+
+
+class ClientDisconnected(Exception):
+    """SSE 클라이언트 연결이 끊김"""
+
+
+class DisconnectGuard:
+    def __init__(self, request, conv_idx, poll_ms: float = DISCONNECT_POLL_MS):
+        self.request = request
+        self.conv_idx = conv_idx
+        self.poll = poll_ms / 1000
+        self.stage = "pipeline"
+        self.tasks = set()
+        self.callbacks = []
+        self.gone = asyncio.get_running_loop().create_future()
+        self._parked = None  # yield 에서 멈춰 있는 에이전트 generator
+        self._closer = None  # 연결이 끊긴 뒤 그 generator 를 닫는 task
+        self._watcher = asyncio.create_task(self._watch())
+
+    @property
+    def disconnected(self):
+        return self.gone.done()
+
+    async def _watch(self):
+        while not await self.request.is_disconnected():
+            await asyncio.sleep(self.poll)
+        self._disconnect()
+
+        if self._parked is not None:
+            agen, self._parked = self._parked, None
+            self._closer = asyncio.create_task(agen.aclose())
+
+    def _disconnect(self):
+        """끊김 처리: 등록된 task 취소, 통계 기록, 콜백 호출 (한 번만)"""
+        if self.gone.done():
+            return
+        cancelled = 0
+        for task in self.tasks:
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        disconnect_stats["disconnects"] += 1
+        disconnect_stats["stages"][self.stage] = disconnect_stats["stages"].get(self.stage, 0) + 1
+        disconnect_stats["tasks_cancelled"] += cancelled
+        print(f"[{self.conv_idx}] 클라이언트 연결 끊김 ({self.stage}) → 진행 중 작업 취소 (task {cancelled}개)")
+        self.gone.set_result(True)
+        for callback in self.callbacks:
+            callback()
+
+    def on_disconnect(self, callback):
+        """연결이 끊기면 호출할 함수 등록"""
+        self.callbacks.append(callback)
+
+    def track(self, task):
+        """연결이 끊기면 취소할 task 등록"""
+        if task is not None:
+            self.tasks.add(task)
+        return task
+
+    async def run(self, aw, stage: str):
+        """aw 를 실행하되 연결이 먼저 끊기면 취소하고 ClientDisconnected 를 던진다."""
+        self.stage = stage
+        if self.disconnected:
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            raise ClientDisconnected(stage)
+        task = asyncio.ensure_future(aw)
+        try:
+            await asyncio.wait({task, self.gone}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            # 취소된 작업이 끝날 때까지 기다린다 (에이전트 generator 가 아직 실행 중이면 aclose() 가 실패)
+            task.cancel()
+            while not task.done():
+                try:
+                    await asyncio.wait({task})
+                except asyncio.CancelledError:
+                    pass  # anyio cancel scope 는 await 마다 다시 취소한다
+            raise
+        if task.done():
+            return task.result()
+        task.cancel()
+        await asyncio.wait({task})
+        raise ClientDisconnected(stage)
+
+    async def stream(self, agen, stage: str):
+        """에이전트 SSE generator 를 그대로 전달하되 연결이 끊기면 중단하고 ClientDisconnected 를 던진다."""
+        self.stage = stage
+        try:
+            while True:
+                chunk = await self.run(agen.__anext__(), stage)
+                self._parked = agen
+                try:
+                    yield chunk
+                finally:
+                    self._parked = None
+        except StopAsyncIteration:
+            return
+        except asyncio.CancelledError:
+            # 응답 전송이 실패하면 폴링보다 먼저 Starlette 가 스트림을 취소한다
+            self._disconnect()
+            raise
+        finally:
+            if self._closer is not None:
+                await asyncio.wait({self._closer})
+            else:
+                await agen.aclose()
+
+    def close(self):
+        self._watcher.cancel()
@@ -0,0 +1,66 @@
+# 검색 질의 임베딩
+# summarize_context_for_search 의 요약문은 사용자 간에 거의 같은 문장이 반복되므로
+# 정규화된 텍스트를 키로 임베딩을 캐시한다. (메모리 LRU/TTL + 선택적 sqlite 디스크 계층)
+# 캐시 미스는 micro-batching 디스패처를 거쳐 동시 요청과 함께 인코딩된다.
+import asyncio, unicodedata
+import numpy as np
+from config import EMBED_CACHE_SIZE, EMBED_CACHE_TTL, EMBED_CACHE_PATH, EMBED_BATCH_WINDOW_MS
+from .cache import LRUCache, SqliteCache
+from .model_loader import get_model
+from .embedding_batcher import batcher
+from .metrics import span
+
+_cache = LRUCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL)
+_disk = SqliteCache(EMBED_CACHE_PATH, EMBED_CACHE_TTL, EMBED_CACHE_SIZE * 10) if EMBED_CACHE_PATH else None
+
+
+def normalize_text(text: str):
+    """유니코드(NFKC)와 공백을 정규화한 캐시 키"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _freeze(vector):
+    # 배치 결과 행렬의 행(view)이 들어오므로 복사본을 캐시한다 (행렬 전체가 캐시에 묶이지 않도록)
+    vector = np.array(vector, dtype=np.float32, copy=True)
+    vector.setflags(write=False)  # 캐시된 배열을 호출 측에서 수정하지 못하도록
+    return vector
+
+
+async def encode_query(text: str):
+    """질의 임베딩 (캐시 → 디스크 → 모델 순으로 조회)"""
+    with span("embedding"):
+        return await _encode_query(text)
+
+
+async def _encode_query(text: str):
+    key = normalize_text(text)
+    vector = _cache.get(key)
+    if vector is not None:
+        return vector
+
+    if _disk is not None:
+        raw = await asyncio.to_thread(_disk.get, key)
+        if raw is not None:
+            vector = _freeze(np.frombuffer(raw, dtype=np.float32))
+            _cache.set(key, vector)
+            return vector
+
+    if EMBED_BATCH_WINDOW_MS > 0:
+        vector = _freeze(await batcher.encode(key))
+    else:
+        vector = _freeze(await asyncio.to_thread(get_model().encode, key))
+    _cache.set(key, vector)
+    if _disk is not None:
+        await asyncio.to_thread(_disk.set, key, vector.tobytes())
+    return vector
+
+
+def embedding_cache_stats():
+    stats = {"memory": _cache.stats()}
+    if _disk is not None:
+        stats["disk"] = _disk.stats()
+    return stats
+
+
+def embedding_batch_stats():
+    return batcher.stats()
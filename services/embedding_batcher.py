@@ -0,0 +1,81 @@
+# 임베딩 micro-batching
+# 동시에 들어온 단일 문장 encode 요청을 짧은 시간(window) 또는 최대 배치 크기까지 모아
+# get_model().encode 를 한 번만 호출하고, 각 호출자에게 자기 벡터를 돌려준다.
+# CPU torch 에서는 단건 10번보다 10건 배치 1번이 훨씬 빠르다.
+import asyncio, time
+from config import EMBED_BATCH_WINDOW_MS, EMBED_BATCH_MAX_SIZE
+from .model_loader import get_model
+
+
+class EmbeddingBatcher:
+    def __init__(self, window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_BATCH_MAX_SIZE):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []  # (text, future, 대기 시작 시각)
+        self._timer = None
+        self._tasks = set()  # 실행 중인 배치 (GC 방지용 참조)
+        # 통계
+        self.batches = 0
+        self.items = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def encode(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.monotonic()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        now = time.monotonic()
+        waits = [now - enqueued_at for _, _, enqueued_at in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.wait_total += sum(waits)
+        self.wait_max = max(self.wait_max, *waits)
+
+        # 같은 문장은 배치 안에서 한 번만 인코딩
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await asyncio.to_thread(get_model().encode, texts, batch_size=len(texts))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future, _ in batch:
+            # 호출자가 이미 취소된 경우는 건너뜀
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "avg_batch_fill": round(self.items / (self.batches * self.max_batch), 4) if self.batches else 0.0,
+            "avg_queue_wait_ms": round(self.wait_total / self.items * 1000, 2) if self.items else 0.0,
+            "max_queue_wait_ms": round(self.wait_max * 1000, 2),
+            "pending": len(self._pending),
+        }
+
+
+batcher = EmbeddingBatcher()
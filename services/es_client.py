@@ -0,0 +1,33 @@
+from elasticsearch import AsyncElasticsearch
+from config import (
+    ELASTIC_URL,
+    ELASTIC_USER,
+    ELASTIC_PASS,
+    ELASTIC_POOL_SIZE,
+    ELASTIC_TIMEOUT,
+)
+
+_es = None  # 전역 캐시
+
+def get_es():
+    """비동기 Elasticsearch 클라이언트를 필요할 때 생성하고, 이미 있으면 재사용.
+    - 노드당 ELASTIC_POOL_SIZE 개의 커넥션을 풀링합니다.
+    - 호출별 타임아웃은 es.options(request_timeout=...) 로 덮어씁니다.
+    """
+    global _es
+    if _es is None:
+        _es = AsyncElasticsearch(
+            ELASTIC_URL,
+            basic_auth=(ELASTIC_USER, ELASTIC_PASS),
+            verify_certs=False,
+            connections_per_node=ELASTIC_POOL_SIZE,
+            request_timeout=ELASTIC_TIMEOUT,
+        )
+    return _es
+
+async def close_es():
+    """앱 종료 시 커넥션 풀 정리"""
+    global _es
+    if _es is not None:
+        await _es.close()
+        _es = None
@@ -0,0 +1,138 @@
+# 토큰 예산 기반 대화 히스토리
+# 프롬프트에는 최근 턴을 원문 그대로(예산 안에서) 넣고, 그보다 오래된 턴은 누적 요약 한 개로 대신한다.
+# 요약은 요청 경로가 아니라 응답이 끝난 뒤 백그라운드에서 점진적으로 갱신한다.
+import asyncio
+import tiktoken
+from langchain_core.messages import SystemMessage
+from config import HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MODEL
+from .llm_gateway import chat_completion
+
+_encoding = None  # 전역 캐시 (BPE 파일을 받을 수 있으므로 기동 시 load_encoding() 으로 이벤트 루프 밖에서 로드)
+_tasks = set()  # 진행 중인 요약 task (GC 방지용 참조)
+
+ROLE_LABELS = {"human": "사용자", "ai": "AI"}
+
+SUMMARY_PROMPT = """
+당신은 법률 상담 대화를 요약하는 역할입니다.
+아래 기존 요약과 그 이후의 대화를 합쳐 요약을 갱신하세요.
+
+- 사건의 주체, 행위, 결과, 법적 쟁점과 사용자가 원하는 도움을 빠짐없이 유지합니다.
+- 10문장 이내의 문어체로 작성합니다.
+
+기존 요약:
+{summary}
+
+이후 대화:
+{dialogue}
+
+갱신된 요약:
+"""
+
+
+def load_encoding():
+    """tiktoken 인코딩 로드 (블로킹: asyncio.to_thread 로 호출). 실패하면 글자 수 추정을 계속 사용"""
+    global _encoding
+    try:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+        print("[HISTORY] tiktoken 인코딩 로드 완료")
+    except Exception as e:
+        print(f"[HISTORY] tiktoken 인코딩 로드 실패, 글자 수로 토큰 수 추정 : {type(e).__name__} - {e}")
+
+
+def count_tokens(text: str):
+    if _encoding is None:
+        # 인코딩 로드 전/실패 시: 한글은 대략 글자당 1토큰 이상이므로 글자 수를 보수적인 추정치로 사용
+        return len(text)
+    return len(_encoding.encode(text))
+
+
+def render(messages):
+    """메시지 목록을 프롬프트용 텍스트로 변환"""
+    lines = []
+    for m in messages:
+        label = ROLE_LABELS.get(m.type)
+        lines.append(f"{label}: {m.content}" if label else m.content)
+    return "\n".join(lines)
+
+
+def _token_counts(session):
+    """메시지별 토큰 수 (새로 추가된 메시지만 계산)"""
+    messages = session.memory.chat_memory.messages
+    counts = session.token_counts
+    while len(counts) < len(messages):
+        counts.append(count_tokens(str(messages[len(counts)].content)))
+    return counts
+
+
+def _window_start(session, budget: int):
+    """요약 이후 메시지 중 예산 안에 들어가는 최근 메시지의 시작 위치"""
+    counts = _token_counts(session)
+    remaining = budget - (count_tokens(session.summary) if session.summary else 0)
+    start = len(counts)
+    while start > session.summarized and counts[start - 1] <= remaining:
+        remaining -= counts[start - 1]
+        start -= 1
+    return start
+
+
+class HistoryView:
+    """ConversationBufferMemory 대신 에이전트/분류기에 넘기는 예산 적용 히스토리
+    - load_memory_variables({}) 는 {"history": [요약, 최근 메시지...]} 를 반환합니다.
+    - str() 은 f-string 프롬프트에 넣을 텍스트입니다.
+    """
+
+    def __init__(self, summary: str, messages):
+        self.summary = summary
+        self.messages = messages
+
+    def load_memory_variables(self, inputs):
+        history = list(self.messages)
+        if self.summary:
+            history.insert(0, SystemMessage(content=f"이전 대화 요약: {self.summary}"))
+        return {"history": history}
+
+    def __str__(self):
+        return render(self.load_memory_variables({})["history"])
+
+
+def history_view(session, budget: int = HISTORY_TOKEN_BUDGET):
+    messages = session.memory.chat_memory.messages
+    return HistoryView(session.summary, messages[_window_start(session, budget):])
+
+
+async def _summarize(session, end: int):
+    # 요약하는 동안 공유 저장소 동기화(_apply_state)로 메시지 목록이 교체되면 end 가 다른 목록을 가리키므로
+    # 시작 시점의 목록과 요약 위치가 그대로일 때만 반영한다. (같은 목록이면 메시지는 뒤에 추가만 됨)
+    messages, start = session.memory.chat_memory.messages, session.summarized
+    try:
+        dialogue = render(messages[start:end])
+        summary = await chat_completion(
+            model=HISTORY_SUMMARY_MODEL,
+            messages=[{"role": "user", "content": SUMMARY_PROMPT.format(
+                summary=session.summary or "(없음)", dialogue=dialogue,
+            )}],
+            temperature=0.2,
+        )
+        if session.memory.chat_memory.messages is not messages or session.summarized != start:
+            print("[HISTORY] 요약 중 세션이 동기화되어 결과를 버림")
+            return
+        session.summary = summary.strip()
+        session.summarized = end
+        print(f"[HISTORY] 요약 갱신 완료 (메시지 {end}개까지)")
+    except Exception as e:
+        print(f"[HISTORY] 요약 갱신 실패 : {type(e).__name__} - {e}")
+    finally:
+        session.summarizing = False
+
+
+def schedule_summary(session, budget: int = HISTORY_TOKEN_BUDGET):
+    """예산 밖으로 밀려난 메시지가 있으면 백그라운드에서 요약에 합친다."""
+    if session.summarizing:
+        return
+    end = _window_start(session, budget)
+    if end <= session.summarized:
+        return
+    session.summarizing = True
+    task = asyncio.create_task(_summarize(session, end))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
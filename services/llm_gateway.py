@@ -0,0 +1,101 @@
+# 공용 비동기 LLM 게이트웨이
+# mode_classifier, summarize_context_for_search, get_llm() 체인이 모두 같은 AsyncOpenAI 클라이언트
+# (httpx 커넥션 풀)를 쓰고, 모델별 semaphore 로 동시 호출 수를 제한한다.
+# 동기 OpenAI 클라이언트로 이벤트 루프를 막는 일이 없도록 LLM 호출은 여기를 거친다.
+import asyncio, random
+from contextlib import asynccontextmanager
+import httpx
+import openai
+from openai import AsyncOpenAI
+from config import (
+    OPENAI_API_KEY,
+    LLM_TIMEOUT,
+    LLM_POOL_SIZE,
+    LLM_MAX_RETRIES,
+    LLM_CONCURRENCY,
+    LLM_MODEL_CONCURRENCY,
+)
+
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # APITimeoutError 포함
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+_client = None  # 전역 캐시
+_semaphores = {}  # model → asyncio.Semaphore
+_close_hooks = []  # 클라이언트를 닫을 때 호출 (클라이언트를 붙잡고 있는 캐시 정리)
+
+
+def get_client():
+    """커넥션 풀을 공유하는 AsyncOpenAI 클라이언트 (재시도는 호출 측에서 처리)"""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=LLM_TIMEOUT,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_SIZE,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                ),
+            ),
+        )
+    return _client
+
+
+def get_semaphore(model: str):
+    if model not in _semaphores:
+        _semaphores[model] = asyncio.Semaphore(LLM_MODEL_CONCURRENCY.get(model, LLM_CONCURRENCY))
+    return _semaphores[model]
+
+
+@asynccontextmanager
+async def llm_slot(model: str):
+    """모델별 동시 호출 슬롯 (스트리밍은 스트림이 끝날 때까지 점유)"""
+    async with get_semaphore(model):
+        yield
+
+
+def backoff_delay(attempt: int):
+    """지수 백오프 + full jitter"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def chat_completion(model: str, messages, temperature: float, **kwargs):
+    """비스트리밍 chat completion 의 응답 텍스트. 일시적 오류는 jitter 를 두고 재시도한다."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with llm_slot(model):
+                res = await get_client().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    **kwargs,
+                )
+            return res.choices[0].message.content
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"[LLM] {model} 호출 실패 ({type(e).__name__}) → {delay:.2f}초 후 재시도")
+            await asyncio.sleep(delay)
+
+
+def on_close(hook):
+    """close_llm() 때 호출할 함수 등록"""
+    _close_hooks.append(hook)
+
+
+async def close_llm():
+    """앱 종료 시 커넥션 풀 정리"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    for hook in _close_hooks:
+        hook()
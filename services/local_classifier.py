@@ -0,0 +1,172 @@
+# mode_classifier 의 로컬 fast path
+# SimCSE 임베딩에 대한 nearest-centroid 분류기. 로그로 쌓인 (발화, 직전 AI 응답 → LLM 판정 모드)로 학습하고,
+# 신뢰도(1, 2위 centroid cosine 차이)가 임계값 이상일 때만 LLM 대신 답한다.
+# "네" / "아니요" / "그만" 같은 짧은 답은 무엇에 대한 답인지에 따라 모드가 달라지므로
+# 특징은 발화 임베딩과 직전 AI 응답 임베딩을 각각 정규화해 이어 붙인 벡터다. (LLM 도 대화 맥락을 보고 판정)
+#
+# 사용법:
+#   python -m services.local_classifier train  --log mode_log.jsonl [--holdout 0.2]
+#   python -m services.local_classifier report --log mode_log.jsonl   # LLM 판정과의 일치율
+import os, json, random, argparse
+import numpy as np
+from config import LOCAL_CLASSIFIER_PATH
+
+MODES = ("free_chat", "info_gathering", "advising", "guidance")
+REPORT_THRESHOLDS = (0.0, 0.02, 0.05, 0.08, 0.1, 0.15, 0.2)
+FEATURES = "query+context"  # 저장 파일의 특징 형식 (형식이 다르면 다시 학습)
+CONTEXT_CHARS = 300  # 직전 AI 응답에서 사용할 마지막 글자 수 (응답 끝의 질문이 맥락의 핵심)
+
+_classifier = None  # 전역 캐시 (파일이 없으면 False)
+
+# 로컬로 답한 수 / LLM 으로 넘긴 수
+classifier_stats = {"local": 0, "llm": 0}
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def features(query_vectors, context_vectors):
+    """발화 임베딩 + 직전 AI 응답 임베딩 (맥락이 없으면 0 벡터)"""
+    return np.concatenate([normalize(query_vectors), normalize(context_vectors)], axis=-1)
+
+
+def recent_context(memory_context):
+    """히스토리의 마지막 AI 응답 끝부분 (없으면 빈 문자열)"""
+    for m in reversed(getattr(memory_context, "messages", None) or []):
+        if m.type == "ai":
+            return str(m.content)[-CONTEXT_CHARS:]
+    return ""
+
+
+class CentroidClassifier:
+    def __init__(self, modes, centroids):
+        self.modes = list(modes)
+        self.centroids = normalize(centroids)
+
+    @classmethod
+    def fit(cls, vectors, labels):
+        vectors = normalize(vectors)
+        labels = np.asarray(labels)
+        modes = [m for m in MODES if (labels == m).any()]
+        centroids = np.stack([vectors[labels == m].mean(axis=0) for m in modes])
+        return cls(modes, centroids)
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        if "features" not in data or str(data["features"]) != FEATURES:
+            raise ValueError(f"특징 형식이 다른 분류기 파일 (기대: {FEATURES}) → train 으로 다시 학습하세요")
+        return cls([str(m) for m in data["modes"]], data["centroids"])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez(path, modes=np.array(self.modes), centroids=self.centroids, features=np.array(FEATURES))
+
+    def predict_many(self, vectors):
+        """(모드 목록, 신뢰도 배열). 신뢰도 = 1위와 2위 centroid 의 cosine 차이"""
+        scores = normalize(vectors) @ self.centroids.T
+        order = np.argsort(scores, axis=1)[:, ::-1]
+        rows = np.arange(len(scores))
+        top = scores[rows, order[:, 0]]
+        second = scores[rows, order[:, 1]] if scores.shape[1] > 1 else np.zeros_like(top)
+        return [self.modes[i] for i in order[:, 0]], top - second
+
+    def predict(self, vector):
+        modes, confidences = self.predict_many(np.asarray(vector)[None, :])
+        return modes[0], float(confidences[0])
+
+
+def get_classifier():
+    """학습된 분류기가 있으면 로드해 재사용 (없으면 None)"""
+    global _classifier
+    if _classifier is None:
+        _classifier = False
+        if LOCAL_CLASSIFIER_PATH and os.path.exists(LOCAL_CLASSIFIER_PATH):
+            try:
+                _classifier = CentroidClassifier.load(LOCAL_CLASSIFIER_PATH)
+                print(f"[LocalClassifier] 로드 완료 ({LOCAL_CLASSIFIER_PATH})")
+            except ValueError as e:
+                print(f"[LocalClassifier] {e}")
+    return _classifier or None
+
+
+# ---------------------------------------------------------------------------
+# 학습 / 리포트
+# ---------------------------------------------------------------------------
+
+def load_log(path: str):
+    """mode_classifier 가 남긴 jsonl 로그 → [(query, context, mode)]"""
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if row.get("query") and row.get("mode") in MODES:
+                pairs.append((row["query"], row.get("context", ""), row["mode"]))
+    return pairs
+
+
+def encode(texts):
+    from .model_loader import get_model
+    return get_model().encode(texts, batch_size=64)
+
+
+def encode_features(rows):
+    """[(query, context, mode)] → 특징 행렬 (맥락이 빈 행은 0 벡터)"""
+    queries = encode([q for q, _, _ in rows])
+    contexts = encode([c or " " for _, c, _ in rows])
+    contexts[[not c for _, c, _ in rows]] = 0.0
+    return features(queries, contexts)
+
+
+def agreement_report(classifier, vectors, labels):
+    """임계값별 로컬 응답 비율과 LLM 판정과의 일치율"""
+    predicted, confidences = classifier.predict_many(vectors)
+    agree = np.array([p == l for p, l in zip(predicted, labels)])
+    print(f"[report] 전체 일치율: {agree.mean():.3f} ({len(labels)}건)")
+    for threshold in REPORT_THRESHOLDS:
+        covered = confidences >= threshold
+        rate = agree[covered].mean() if covered.any() else 0.0
+        print(f"[report] threshold={threshold:.2f} → 로컬 응답 {covered.mean():.3f}, 일치율 {rate:.3f}")
+
+    print("[report] 혼동 행렬 (행: LLM 판정, 열: 로컬 예측)")
+    print("  " + " " * 16 + " ".join(f"{m:>15}" for m in MODES))
+    for actual in MODES:
+        counts = [sum(1 for p, l in zip(predicted, labels) if l == actual and p == m) for m in MODES]
+        print(f"  {actual:>15} " + " ".join(f"{c:>15}" for c in counts))
+
+
+def train(log_path: str, out_path: str, holdout: float):
+    pairs = load_log(log_path)
+    random.Random(0).shuffle(pairs)
+    split = int(len(pairs) * (1 - holdout))
+    train_pairs, test_pairs = pairs[:split], pairs[split:]
+    print(f"[train] 학습 {len(train_pairs)}건 / 검증 {len(test_pairs)}건")
+
+    classifier = CentroidClassifier.fit(encode_features(train_pairs), [m for _, _, m in train_pairs])
+    classifier.save(out_path)
+    print(f"[train] 저장 완료: {out_path}")
+
+    if test_pairs:
+        agreement_report(classifier, encode_features(test_pairs), [m for _, _, m in test_pairs])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="mode_classifier 로컬 분류기 학습/리포트")
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("--log", required=True, help="발화→모드 jsonl 로그 (MODE_LOG_PATH)")
+    parser.add_argument("--out", default=LOCAL_CLASSIFIER_PATH or "local_classifier.npz")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        train(args.log, args.out, args.holdout)
+    else:
+        pairs = load_log(args.log)
+        agreement_report(CentroidClassifier.load(args.out), encode_features(pairs), [m for _, _, m in pairs])
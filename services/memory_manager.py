@@ -1,62 +1,134 @@
-from collections import defaultdict
+import time, weakref
+from collections import OrderedDict
 from langchain.memory import ConversationBufferMemory
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from config import SESSION_MAX, SESSION_IDLE_TTL, SESSION_MAX_BYTES
+from .history_manager import history_view, schedule_summary
+from .session_store import create_session_store
+
+# 저장 시 version 충돌이 나면 최신 상태 위에 이번 턴을 다시 얹어 재시도하는 횟수
+COMMIT_RETRIES = 5
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+# 세션 하나의 고정 오버헤드 추정치 (메모리 객체 + 레코드)
+SESSION_BASE_BYTES = 2048
+
+
+class Session:
+    """세션 레코드 (dict 대신 __slots__ 로 속성만 보관)"""
+    __slots__ = (
+        "memory", "mode", "info_rounds", "last_access", "size",
+        "summary", "summarized", "token_counts", "summarizing",
+        "version", "base_len", "__weakref__",
+    )
 
-class MemoryManager:
     def __init__(self):
-        """세션별 LangChain 메모리 및 모드 관리"""
-        self.sessions = defaultdict(lambda: {
-            "memory": ConversationBufferMemory(
-                memory_key="history",
-                return_messages=True,
-                ),
-            "mode": "free_chat",
-            "info_rounds": 0,
-        })
+        self.memory = ConversationBufferMemory(
+            memory_key="history",
+            return_messages=True,
+        )
+        self.mode = "free_chat"
+        self.info_rounds = 0
+        self.last_access = time.monotonic()
+        self.size = SESSION_BASE_BYTES
+        # 토큰 예산 히스토리 (services/history_manager.py)
+        self.summary = ""        # 오래된 턴의 누적 요약
+        self.summarized = 0      # 요약에 반영된 메시지 수
+        self.token_counts = []   # 메시지별 토큰 수 캐시
+        self.summarizing = False
+        # 공유 저장소 (services/session_store.py)
+        self.version = 0         # 마지막으로 읽거나 저장한 저장소 version
+        self.base_len = None     # 이번 턴 시작 시점의 메시지 수 (턴 밖이면 None)
+
+
+class MemoryManager:
+    def __init__(self, max_sessions: int = SESSION_MAX, idle_ttl: float = SESSION_IDLE_TTL,
+                 max_bytes: int = SESSION_MAX_BYTES, store="default"):
+        """세션별 LangChain 메모리 및 모드 관리
+        - 세션 수 / 유휴 시간 / 메시지 바이트 합계로 제한되는 LRU 저장소입니다.
+        - 밀려난 세션은 다음 요청에서 파이프라인이 DB 기록으로 다시 복원합니다.
+        - 공유 저장소(store)가 있으면 이 객체는 워커별 캐시가 되고, begin_turn/end_turn 으로 동기화합니다.
+        """
+        self.store = create_session_store(ttl=idle_ttl) if store == "default" else store
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()  # conv_idx → Session (오래 사용하지 않은 순)
+        self._turns = weakref.WeakValueDictionary()  # conv_idx → 턴 진행 중인 Session (begin_turn ~ end_turn)
+        self.total_bytes = 0
+        self.evictions = {"lru": 0, "idle": 0, "bytes": 0}
+        self.restores = 0
 
     def ensure_session(self, conv_idx):
         """세션이 없으면 새로 만들어주는 함수"""
-        if conv_idx not in self.sessions:
-            self.sessions[conv_idx] = {
-                "memory": ConversationBufferMemory(
-                    memory_key="history",
-                    return_messages=True,
-                    ),
-                "mode": "free_chat",
-                "info_rounds": 0,
-            }
+        now = time.monotonic()
+        session = self.sessions.get(conv_idx)
+        if session is not None and now - session.last_access > self.idle_ttl:
+            self._evict(conv_idx, "idle")
+            session = None
+        if session is None:
+            # 턴 도중 밀려난 세션은 턴이 끝날 때까지 같은 객체를 되살려, 이번 턴의 변경이 새 세션으로 흩어지지 않게 함
+            session = self._turns.get(conv_idx) or Session()
+            self.sessions[conv_idx] = session
+            self.total_bytes += session.size
+        else:
+            self.sessions.move_to_end(conv_idx)
+        session.last_access = now
+        self._enforce_limits(now)
+        return session
+
+    def _evict(self, conv_idx, reason):
+        session = self.sessions.pop(conv_idx)
+        self.total_bytes -= session.size
+        self.evictions[reason] += 1
+
+    def _enforce_limits(self, now):
+        # 가장 오래된 세션부터 확인하므로 유휴 세션은 앞쪽에 모여 있다.
+        while self.sessions:
+            oldest_idx, oldest = next(iter(self.sessions.items()))
+            if now - oldest.last_access > self.idle_ttl:
+                self._evict(oldest_idx, "idle")
+            else:
+                break
+        # 방금 사용한 세션(맨 뒤)은 남긴다.
+        while len(self.sessions) > 1 and len(self.sessions) > self.max_sessions:
+            self._evict(next(iter(self.sessions)), "lru")
+        while len(self.sessions) > 1 and self.total_bytes > self.max_bytes:
+            self._evict(next(iter(self.sessions)), "bytes")
 
     def get_memory(self, conv_idx):
         """특정 세션의 LangChain Memory 반환"""
-        self.ensure_session(conv_idx)
-        return self.sessions[conv_idx]["memory"]
+        return self.ensure_session(conv_idx).memory
+
+    def get_history(self, conv_idx):
+        """프롬프트용 히스토리 (최근 턴 원문 + 오래된 턴 요약, 토큰 예산 적용)"""
+        return history_view(self.ensure_session(conv_idx))
+
+    def schedule_summary(self, conv_idx):
+        """응답이 끝난 뒤 호출: 예산 밖으로 밀려난 턴을 백그라운드에서 요약"""
+        schedule_summary(self.ensure_session(conv_idx))
 
     def get_mode(self, conv_idx):
         """특정 세션의 conv_idx 반환"""
-        self.ensure_session(conv_idx)
-        return self.sessions[conv_idx]["mode"]
+        return self.ensure_session(conv_idx).mode
 
     def set_mode(self, conv_idx, mode):
         """특정 세션의 모드 변경"""
-        self.ensure_session(conv_idx)
-        self.sessions[conv_idx]["mode"] = mode
+        self.ensure_session(conv_idx).mode = mode
 
     def get_info_rounds(self, conv_idx):
-        self.ensure_session(conv_idx)
-        return int(self.sessions[conv_idx].get("info_rounds", 0))
+        return int(self.ensure_session(conv_idx).info_rounds)
 
     def increment_info_rounds(self, conv_idx):
-        self.ensure_session(conv_idx)
-        self.sessions[conv_idx]["info_rounds"] = int(self.sessions[conv_idx].get("info_rounds", 0)) + 1
+        session = self.ensure_session(conv_idx)
+        session.info_rounds = int(session.info_rounds) + 1
 
     def reset_info_rounds(self, conv_idx):
-        self.ensure_session(conv_idx)
-        self.sessions[conv_idx]["info_rounds"] = 0
+        self.ensure_session(conv_idx).info_rounds = 0
 
     def add(self, conv_idx, role, content):
         """대화를 LangChain Memory에 추가"""
-        self.ensure_session(conv_idx)
-        memory = self.sessions[conv_idx]["memory"]
+        session = self.ensure_session(conv_idx)
 
         # 역할에 따라 올바른 메시지 객체로 변환
         if role == "user":
@@ -68,4 +140,116 @@ class MemoryManager:
         else:
             raise ValueError(f"Unknown role: {role}")
 
-        memory.chat_memory.add_message(msg)
+        session.memory.chat_memory.add_message(msg)
+        size = len(content.encode("utf-8"))
+        session.size += size
+        self.total_bytes += size
+        self._enforce_limits(session.last_access)
+
+    def restore(self, conv_idx, db_records):
+        """DB 기록(question/answer)으로 세션 메모리 복원"""
+        for row in db_records:
+            if row.get("question"):
+                self.add(conv_idx, "user", row["question"])
+            if row.get("answer"):
+                self.add(conv_idx, "ai", row["answer"])
+        session = self.ensure_session(conv_idx)
+        if session.base_len is not None:
+            # 턴 도중 복원한 기록은 이번 턴의 변경이 아니므로, 충돌 병합 시 다시 얹지 않도록 기준점을 옮긴다
+            session.base_len = len(session.memory.chat_memory.messages)
+        self.restores += 1
+
+    # ------------------------------------------------------------------
+    # 공유 저장소 동기화
+    # ------------------------------------------------------------------
+
+    def _snapshot(self, session):
+        return {
+            "messages": [[m.type, m.content] for m in session.memory.chat_memory.messages],
+            "mode": session.mode,
+            "info_rounds": session.info_rounds,
+            "summary": session.summary,
+            "summarized": session.summarized,
+        }
+
+    def _apply_state(self, conv_idx, session, state, version):
+        """저장소 상태로 로컬 세션을 교체"""
+        messages = [MESSAGE_TYPES[t](content=c) for t, c in state["messages"]]
+        session.memory.chat_memory.messages = messages
+        session.mode = state["mode"]
+        session.info_rounds = state["info_rounds"]
+        session.summary = state["summary"]
+        session.summarized = state["summarized"]
+        session.token_counts = []
+        size = SESSION_BASE_BYTES + sum(len(c.encode("utf-8")) for _, c in state["messages"])
+        if self.sessions.get(conv_idx) is session:
+            self.total_bytes += size - session.size
+        session.size = size
+        session.version = version
+
+    async def begin_turn(self, conv_idx):
+        """턴 시작: 다른 워커가 더 최신 상태를 저장했으면 읽어온다.
+        반환한 세션을 턴이 끝날 때 end_turn 에 넘기며, 그동안은 LRU 에서 밀려나도 같은 세션을 사용한다."""
+        session = self.ensure_session(conv_idx)
+        self._turns[conv_idx] = session
+        if self.store is not None and await self.store.version(conv_idx) != session.version:
+            state, version = await self.store.load(conv_idx)
+            if state is not None:
+                self._apply_state(conv_idx, session, state, version)
+                print(f"[{conv_idx}] 공유 저장소에서 세션 동기화 (version {version})")
+            else:
+                session.version = 0  # 저장소에서 만료/삭제됨: 로컬 상태를 새로 저장
+        session.base_len = len(session.memory.chat_memory.messages)
+        return session
+
+    async def end_turn(self, conv_idx, session=None):
+        """턴 종료: version 이 그대로면 저장, 그 사이 다른 턴이 저장했으면 그 위에 이번 턴을 다시 얹는다.
+        - session: begin_turn 이 돌려준 세션 (턴 도중 밀려났어도 이번 턴의 메시지/모드/정보수집 횟수를 저장)
+        """
+        if session is None:
+            session = self._turns.get(conv_idx)
+        if session is not None and self._turns.get(conv_idx) is session:
+            del self._turns[conv_idx]
+        if self.store is None or session is None or session.base_len is None:
+            return
+
+        for _ in range(COMMIT_RETRIES):
+            if await self.store.save(conv_idx, self._snapshot(session), session.version):
+                session.version += 1
+                break
+            state, version = await self.store.load(conv_idx)
+            if state is None:
+                session.version = 0  # 턴 도중 저장소에서 만료/삭제됨: 이번 턴까지의 상태를 새로 저장
+                continue
+            delta = self._snapshot(session)
+            merged = {
+                "messages": state["messages"] + delta["messages"][session.base_len:],
+                # 모드/정보수집 횟수는 이번 턴의 결정이 가장 최신
+                "mode": delta["mode"],
+                "info_rounds": delta["info_rounds"],
+                "summary": state["summary"],
+                "summarized": state["summarized"],
+            }
+            # 이번 턴 시작 전 메시지까지만 다룬 로컬 요약이 더 길면 그대로 사용
+            if state["summarized"] < delta["summarized"] <= session.base_len:
+                merged["summary"], merged["summarized"] = delta["summary"], delta["summarized"]
+            session.base_len = len(state["messages"])
+            self._apply_state(conv_idx, session, merged, version)
+            print(f"[{conv_idx}] 세션 version 충돌 → 최신 상태(version {version}) 위에 다시 저장")
+        else:
+            print(f"[{conv_idx}] 세션 저장 실패 (충돌 반복)")
+        session.base_len = None
+
+    async def close(self):
+        if self.store is not None:
+            await self.store.close()
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": dict(self.evictions),
+            "restores": self.restores,
+        }
@@ -0,0 +1,127 @@
+# 요청 단계별 지연 시간 계측과 Prometheus /metrics
+# - span(stage): 구간 시간을 stage 별 히스토그램에 기록하고, 진행 중인 요청 trace 에도 누적한다.
+# - RequestTrace: 요청 하나의 span / TTFT / 전체 스트림 시간을 모아 끝날 때 구조화 로그 한 줄로 남긴다.
+#   (contextvar 로 전달되므로 create_task 로 띄운 투기적 검색 등 하위 task 의 span 도 같은 trace 에 모인다.)
+# - register_stats(name, fn): 각 모듈의 통계 dict 를 스크레이프 시점에 gauge 로 내보낸다.
+import json
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+from config import TOKEN_LOG_SAMPLE
+
+logger = logging.getLogger("hellaw")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "hellaw_stage_seconds", "요청 단계별 소요 시간", ["stage"], buckets=LATENCY_BUCKETS,
+)
+TTFT_SECONDS = Histogram(
+    "hellaw_ttft_seconds", "요청 수신부터 첫 토큰 전송까지", ["mode"], buckets=LATENCY_BUCKETS,
+)
+STREAM_SECONDS = Histogram(
+    "hellaw_stream_seconds", "요청 수신부터 스트림 종료까지", ["mode"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "hellaw_requests", "모드/도메인/결과별 요청 수", ["mode", "domain", "status"],
+)
+
+_trace = ContextVar("hellaw_trace", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """구간 시간 기록 (예외/취소로 끝난 구간은 기록하지 않음)"""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    STAGE_SECONDS.labels(stage).observe(elapsed)
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans[stage] = trace.spans.get(stage, 0.0) + elapsed
+
+
+class RequestTrace:
+    def __init__(self, conv_idx, domain: str):
+        self.conv_idx = conv_idx
+        self.domain = domain
+        self.mode = "unknown"
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.ttft = None
+        self.activate()
+
+    def activate(self):
+        """현재 context 에 trace 설정 (StreamingResponse 는 다른 context 에서 generator 를 돌릴 수 있음)"""
+        _trace.set(self)
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+            TTFT_SECONDS.labels(self.mode).observe(self.ttft)
+
+    def finish(self, status: str = "ok"):
+        total = time.perf_counter() - self.start
+        STREAM_SECONDS.labels(self.mode).observe(total)
+        REQUESTS.labels(self.mode, self.domain, status).inc()
+        logger.info(json.dumps({
+            "event": "request",
+            "conv_idx": self.conv_idx,
+            "mode": self.mode,
+            "domain": self.domain,
+            "status": status,
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "total_ms": round(total * 1000, 1),
+            "spans_ms": {k: round(v * 1000, 1) for k, v in self.spans.items()},
+        }, ensure_ascii=False))
+
+
+def log_frame(mode: str, conv_idx, chunk: str):
+    """토큰 프레임 로그 (DEBUG 레벨에서 TOKEN_LOG_SAMPLE 비율만)"""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < TOKEN_LOG_SAMPLE:
+        logger.debug(json.dumps(
+            {"event": "frame", "conv_idx": conv_idx, "mode": mode, "chunk": chunk[:100]},
+            ensure_ascii=False,
+        ))
+
+
+# ----------------------------------------------------------------------
+# 모듈별 통계 dict → gauge
+# ----------------------------------------------------------------------
+
+_stats_sources = {}
+
+
+def register_stats(name: str, fn):
+    """fn() 이 반환하는 (중첩) dict 의 숫자 값을 hellaw_<name>_<key...> gauge 로 노출"""
+    _stats_sources[name] = fn
+
+
+def _flatten(prefix, value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(f"{prefix}_{key}", item)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield re.sub(r"[^a-zA-Z0-9_]", "_", prefix), value
+
+
+class StatsCollector:
+    def collect(self):
+        for name, fn in _stats_sources.items():
+            for metric, value in _flatten(f"hellaw_{name}", fn()):
+                gauge = GaugeMetricFamily(metric, f"{name} 통계")
+                gauge.add_metric([], value)
+                yield gauge
+
+
+REGISTRY.register(StatsCollector())
+
+
+def render_metrics():
+    """(본문, content type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,13 +1,33 @@
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import LOCAL_CLASSIFIER_THRESHOLD, MODE_LOG_PATH
+from .llm_gateway import chat_completion
+from .embedding import encode_query
+from .local_classifier import get_classifier, classifier_stats, features, recent_context
 import asyncio, json
+import numpy as np
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+def log_mode(user_query: str, context: str, domain: str, mode: str):
+    """로컬 분류기 학습용 (발화, 직전 AI 응답 → LLM 판정 모드) 기록"""
+    row = {"query": user_query, "context": context, "domain": domain, "mode": mode}
+    with open(MODE_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
 async def mode_classifier(user_query: str, memory_context: str, domain: str):
     """
     LLM 기반 대화 단계 분류기.
+    - 로컬 분류기(services/local_classifier.py)의 신뢰도가 임계값 이상이면 LLM 호출 없이 판정합니다.
+      (발화와 직전 AI 응답을 함께 보고, LOCAL_CLASSIFIER_THRESHOLD 를 주지 않으면 사용하지 않음)
     """
+    context = recent_context(memory_context)
+    classifier = get_classifier() if LOCAL_CLASSIFIER_THRESHOLD is not None else None
+    if classifier is not None:
+        query_vector = await encode_query(user_query)
+        context_vector = await encode_query(context) if context else np.zeros_like(query_vector)
+        mode, confidence = classifier.predict(features(query_vector, context_vector))
+        if confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+            classifier_stats["local"] += 1
+            return {"next_mode": mode, "reason": f"로컬 분류기 판정 (신뢰도 {confidence:.3f})"}
+    classifier_stats["llm"] += 1
+
     prompt = f"""
     당신은 법률 상담 대화의 단계 판별을 담당하는 역할입니다.
 
@@ -37,21 +57,20 @@ async def mode_classifier(user_query: str, memory_context: str, domain: str):
     }}
     """
 
-    loop = asyncio.get_event_loop()
-    res = await loop.run_in_executor(
-        None,
-        lambda: client.chat.completions.create(
-            model="gpt-4o-mini",  # 더 빠른 모델
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.4
-        )
+    content = await chat_completion(
+        model="gpt-4o-mini",  # 더 빠른 모델
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.4
     )
 
-
     try:
-        content = res.choices[0].message.content.strip()
+        content = content.strip()
         content = content[content.find("{") : content.rfind("}") + 1]
-        return json.loads(content)
+        result = json.loads(content)
     except Exception as e:
         print(f"[ModeClassifier ParseError] {e}")
-        return {"next_mode": "free_chat", "reason": "판단 실패"}
\ No newline at end of file
+        return {"next_mode": "free_chat", "reason": "판단 실패"}
+
+    if MODE_LOG_PATH:
+        await asyncio.to_thread(log_mode, user_query, context, domain, result.get("next_mode"))
+    return result
\ No newline at end of file
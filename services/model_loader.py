@@ -1,5 +1,6 @@
-import os
-from sentence_transformers import SentenceTransformer
+import os, sys, argparse, threading
+import numpy as np
+from config import ENCODER_BACKEND, ENCODER_ONNX_DIR, ENCODER_QUANT_CONFIG
 
 os.environ["HF_HOME"] = os.path.join(os.getcwd(), "hf_cache")
 os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
@@ -7,13 +8,122 @@ os.environ["CURL_CA_BUNDLE"] = ""
 
 MODEL_PATH = "snumin44/simcse-ko-roberta-unsupervised"
 
+# 백엔드별 ONNX 파일 (ENCODER_ONNX_DIR 기준 상대 경로)
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": f"onnx/model_qint8_{ENCODER_QUANT_CONFIG}.onnx",
+}
+
+# 백엔드 간 임베딩 cosine 유사도 허용 하한 (torch 기준)
+PARITY_TOLERANCE = {
+    "onnx": 0.9999,
+    "onnx-int8": 0.98,
+}
+
+PARITY_SENTENCES = [
+    "보행자가 빨간불에 횡단보도를 건너다 좌회전 차량과 충돌한 사고에서 과실비율 판단",
+    "임차인이 월세를 연체하여 계약이 해지된 경우 보증금 반환 범위",
+    "근로자가 정당한 이유 없이 해고된 경우 부당해고 인정 여부",
+    "수술 후 후유증이 발생한 경우 의료진의 설명의무 위반 여부",
+]
+
 _model = None  # 전역 캐시
+_model_lock = threading.Lock()  # 여러 스레드에서 동시에 첫 로드를 시작하지 않도록
+
+def load_model(backend: str = ENCODER_BACKEND, fallback: bool = True):
+    """지정한 추론 백엔드로 모델 로드 (torch | onnx | onnx-int8)
+    - ONNX 파일이 없으면 torch 로 로드합니다. (fallback=False 이면 FileNotFoundError)
+    """
+    # torch/transformers import 가 무거우므로 실제로 로드할 때만 import
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(MODEL_PATH)
+
+    file_name = ONNX_FILES[backend]
+    if not os.path.exists(os.path.join(ENCODER_ONNX_DIR, file_name)):
+        if not fallback:
+            raise FileNotFoundError(f"{backend} 모델 파일 없음: {os.path.join(ENCODER_ONNX_DIR, file_name)}")
+        print(f"{backend} 모델 파일 없음 ({file_name}) → torch 백엔드로 로드합니다. "
+              f"'python -m services.model_loader export' 로 먼저 생성하세요.")
+        return SentenceTransformer(MODEL_PATH)
+    return SentenceTransformer(ENCODER_ONNX_DIR, backend="onnx", model_kwargs={"file_name": file_name})
 
 def get_model():
     """필요할 때만 모델을 불러오고, 이미 있으면 재사용."""
     global _model
     if _model is None:
-        print("모델 로드 시작...")
-        _model = SentenceTransformer(MODEL_PATH)
-        print("모델 로드 완료.")
+        with _model_lock:
+            if _model is None:
+                print(f"모델 로드 시작... (backend={ENCODER_BACKEND})")
+                _model = load_model()
+                print("모델 로드 완료.")
     return _model
+
+def is_model_loaded():
+    return _model is not None
+
+def runtime_versions():
+    """ONNX 백엔드가 쓰는 패키지 버전 (optimum.onnxruntime 을 import 할 수 없으면 ImportError)
+    requirements.txt 에 고정한 torch / transformers / sentence-transformers / optimum 조합 확인용"""
+    from importlib import metadata
+    import optimum.onnxruntime  # noqa: F401  sentence-transformers ONNX 백엔드가 사용
+
+    packages = ("torch", "transformers", "sentence-transformers", "optimum", "onnxruntime")
+    return {name: metadata.version(name) for name in packages}
+
+def check_parity(model, reference, tolerance: float, sentences=PARITY_SENTENCES):
+    """reference(torch) 대비 문장별 cosine 유사도가 tolerance 이상인지 확인"""
+    a = model.encode(sentences, normalize_embeddings=True)
+    b = reference.encode(sentences, normalize_embeddings=True)
+    similarities = np.sum(a * b, axis=1)
+    return bool(similarities.min() >= tolerance), similarities
+
+def export(quant_config: str = ENCODER_QUANT_CONFIG):
+    """ONNX(fp32) 그래프와 동적 int8 양자화 그래프를 ENCODER_ONNX_DIR 에 생성하고 torch 대비 검증"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    onnx_model = SentenceTransformer(MODEL_PATH, backend="onnx")
+    onnx_model.save(ENCODER_ONNX_DIR)
+    export_dynamic_quantized_onnx_model(onnx_model, quant_config, ENCODER_ONNX_DIR)
+    print(f"ONNX 모델 저장 완료: {ENCODER_ONNX_DIR}")
+
+    reference = load_model("torch")
+    results = [parity(backend, reference) for backend in ONNX_FILES]
+    return all(results)
+
+def parity(backend: str, reference=None):
+    """backend 가 실제로 ONNX 로 로드됐는지 확인하고 torch 대비 임베딩 parity 검증
+    (ONNX 파일이 없어 torch 로 대신 로드되면 torch 끼리 비교하게 되므로 실패로 처리)"""
+    try:
+        versions = runtime_versions()
+        model = load_model(backend, fallback=False)
+    except (ImportError, FileNotFoundError) as e:
+        print(f"[parity] {backend}: {type(e).__name__} - {e} → FAIL")
+        return False
+    print("[parity] " + ", ".join(f"{name}={version}" for name, version in versions.items()))
+    loaded = getattr(model, "backend", "torch")
+    if loaded != "onnx":
+        print(f"[parity] {backend}: ONNX 백엔드로 로드되지 않음 ({loaded}) → FAIL")
+        return False
+
+    ok, similarities = check_parity(model, reference or load_model("torch"), PARITY_TOLERANCE[backend])
+    print(f"[parity] {backend}: min={similarities.min():.5f} mean={similarities.mean():.5f} "
+          f"(기준 {PARITY_TOLERANCE[backend]}) → {'OK' if ok else 'FAIL'}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="문장 인코더 ONNX 변환 및 parity 검증")
+    parser.add_argument("command", choices=["export", "parity"])
+    parser.add_argument("--quant-config", default=ENCODER_QUANT_CONFIG,
+                        help="동적 양자화 설정 (arm64 | avx2 | avx512 | avx512_vnni)")
+    parser.add_argument("--backend", choices=list(ONNX_FILES),
+                        default=ENCODER_BACKEND if ENCODER_BACKEND in ONNX_FILES else "onnx",
+                        help="parity 를 확인할 백엔드 (기본: ENCODER_BACKEND)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        passed = export(args.quant_config)
+    else:
+        passed = parity(args.backend)
+    sys.exit(0 if passed else 1)
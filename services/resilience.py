@@ -0,0 +1,250 @@
+# 판례 검색 경로의 마감 시간 / ES 요청 헤징 / 서킷 브레이커
+# - deadline(seconds): 블록과 그 안에서 만든 task 에 마감 시각을 전달 (contextvar)
+#   within_deadline(aw) 와 es_call(...) 이 남은 시간만큼만 기다린다.
+# - es_call: 서킷이 열려 있으면 바로 CircuitOpen, 아니면 요청 후 최근 지연 시간 백분위를 넘기면
+#   같은 요청을 한 번 더 보내 먼저 끝난 응답을 쓴다. (검색/원문 조회는 읽기 전용이라 중복 요청이 안전)
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+from elastic_transport import TransportError, ConnectionTimeout
+from elasticsearch import ApiError
+from config import (
+    ES_HEDGE,
+    ES_HEDGE_PERCENTILE,
+    ES_HEDGE_DELAY,
+    ES_BREAKER_FAILURES,
+    ES_BREAKER_RESET,
+)
+
+# 헤징 지연을 계산할 최소 표본 수 / 보관할 최근 표본 수
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+
+_deadline = ContextVar("retrieval_deadline", default=None)
+_degraded = ContextVar("retrieval_degraded", default=None)
+
+# - hedges    : 두 번째 요청을 보낸 수
+# - hedge_wins: 두 번째 요청이 먼저 끝난 수
+# - degraded  : 단계별 품질 저하 횟수 (요약 생략 / 도메인 없는 재검색 생략 / 원문 대신 chunk / 판례 검색 포기)
+resilience_stats = {
+    "hedges": 0,
+    "hedge_wins": 0,
+    "degraded": {"summary": 0, "fallback_search": 0, "fetch": 0, "unavailable": 0},
+}
+
+
+class CircuitOpen(Exception):
+    """ES 서킷이 열려 있어 요청을 보내지 않음"""
+
+
+# 판례 검색을 포기할 ES 측 실패
+ES_FAILURES = (asyncio.TimeoutError, CircuitOpen, TransportError, ApiError)
+
+
+def degrade(stage: str):
+    resilience_stats["degraded"][stage] += 1
+    stages = _degraded.get()
+    if stages is not None:
+        stages.append(stage)
+
+
+@contextmanager
+def track_degraded():
+    """블록 안에서 degrade() 된 단계 목록 (품질을 낮춘 결과는 캐시하지 않도록)"""
+    stages = []
+    token = _degraded.set(stages)
+    try:
+        yield stages
+    finally:
+        _degraded.reset(token)
+
+
+# ----------------------------------------------------------------------
+# 마감 시간
+# ----------------------------------------------------------------------
+
+@contextmanager
+def deadline(seconds: float):
+    """마감 시각 설정 (바깥 마감이 더 이르면 그대로 유지)"""
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(cap: float = None):
+    """남은 시간(초). 마감이 없으면 cap (cap 도 없으면 None)"""
+    at = _deadline.get()
+    left = None if at is None else max(at - time.monotonic(), 0.0)
+    if cap is not None:
+        left = cap if left is None else min(left, cap)
+    return left
+
+
+async def within_deadline(aw, cap: float = None):
+    """남은 시간 안에 끝나지 않으면 취소하고 asyncio.TimeoutError"""
+    timeout = remaining(cap)
+    if timeout is not None and timeout <= 0:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise asyncio.TimeoutError
+    return await asyncio.wait_for(aw, timeout)
+
+
+# ----------------------------------------------------------------------
+# 서킷 브레이커 / 헤징
+# ----------------------------------------------------------------------
+
+class CircuitBreaker:
+    """closed → (연속 실패) → open → (reset 초 후) half_open: 시험 요청 하나만 허용 → 성공 시 closed"""
+
+    def __init__(self, failures: int = ES_BREAKER_FAILURES, reset: float = ES_BREAKER_RESET):
+        self.threshold = failures
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.opens = 0
+        self.rejected = 0
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset:
+            self.state = "half_open"
+        if self.state == "open" or (self.state == "half_open" and self.trial):
+            self.rejected += 1
+            raise CircuitOpen("Elasticsearch 서킷 open")
+        if self.state == "half_open":
+            self.trial = True
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.opens += 1
+                print(f"[ES 서킷] open ({self.failures}회 연속 실패, {self.reset:.0f}초 동안 차단)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """호출 측 취소 / 요청별 마감으로 잘린 타임아웃처럼 ES 상태와 무관하게 결과 없이 끝난 요청"""
+        self.trial = False
+
+    def stats(self):
+        return {
+            "open": int(self.state == "open"),
+            "half_open": int(self.state == "half_open"),
+            "consecutive_failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    def __init__(self):
+        self.samples = deque(maxlen=HEDGE_WINDOW)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_delay(self):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return ES_HEDGE_DELAY
+        return float(np.percentile(self.samples, ES_HEDGE_PERCENTILE))
+
+
+es_breaker = CircuitBreaker()
+_latency = {}  # 요청 종류 → LatencyTracker
+
+
+def _consume(task):
+    # 버려진 요청의 예외가 "never retrieved" 경고로 남지 않도록
+    if not task.cancelled():
+        task.exception()
+
+
+async def _hedged(fn, timeout: float, delay: float):
+    tasks = [asyncio.ensure_future(fn(timeout))]
+    tasks[0].add_done_callback(_consume)
+    try:
+        if not ES_HEDGE or delay >= timeout:
+            return await tasks[0]
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+
+        resilience_stats["hedges"] += 1
+        tasks.append(asyncio.ensure_future(fn(timeout - delay)))
+        tasks[1].add_done_callback(_consume)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[1]:
+                        resilience_stats["hedge_wins"] += 1
+                    return task.result()
+        return tasks[0].result()  # 둘 다 실패하면 첫 요청의 예외
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def es_call(name: str, fn, cap: float):
+    """fn(timeout) 이 만드는 ES 요청을 마감 시간 / 서킷 / 헤징을 적용해 실행
+    - cap: 이 요청 종류의 최대 타임아웃 (ELASTIC_SEARCH_TIMEOUT 등)
+    """
+    es_breaker.allow()
+    timeout = remaining(cap)
+    if timeout <= 0:
+        es_breaker.abandon()
+        raise asyncio.TimeoutError
+    # 요청별 마감 때문에 cap 보다 짧아진 타임아웃은 ES 가 느려서가 아니므로 실패로 세지 않음
+    truncated = timeout < cap
+
+    tracker = _latency.setdefault(name, LatencyTracker())
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(_hedged(fn, timeout, tracker.hedge_delay()), timeout)
+    except asyncio.CancelledError:
+        es_breaker.abandon()
+        raise
+    except (asyncio.TimeoutError, ConnectionTimeout):
+        if truncated:
+            es_breaker.abandon()
+        else:
+            es_breaker.failure()
+        raise
+    except TransportError:
+        es_breaker.failure()
+        raise
+    except ApiError as e:
+        if e.meta.status >= 500:
+            es_breaker.failure()
+        else:
+            es_breaker.success()
+        raise
+    es_breaker.success()
+    tracker.record(time.monotonic() - start)
+    return result
+
+
+def resilience_summary():
+    return {
+        **resilience_stats,
+        "breaker": es_breaker.stats(),
+        "hedge_delay_ms": {name: round(t.hedge_delay() * 1000, 1) for name, t in _latency.items()},
+    }
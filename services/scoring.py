@@ -0,0 +1,80 @@
+# hybrid_search 의 의미 기반 재정렬 엔진
+# - ES hit 의 벡터를 연속된 float32 버퍼로 바로 모은다.
+# - chunk id 별 unit-normalize 된 벡터를 LRU 로 캐시해 norm 계산을 반복하지 않는다.
+# - 전체 argsort 대신 doc_id 별 최고 점수 chunk 만 남긴 뒤 argpartition 으로 상위 k 개만 정렬한다.
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import SCORING_VECTOR_CACHE_SIZE
+
+
+def top_unique(doc_ids, scores, k: int):
+    """doc_id 별 최고 점수 행만 남기고 점수 내림차순 상위 k 개의 행 번호를 반환"""
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    _, inverse = np.unique(np.asarray(doc_ids), return_inverse=True)
+    best = np.full(inverse.max() + 1, -np.inf, dtype=np.float32)
+    np.maximum.at(best, inverse, scores)
+
+    # 같은 점수의 chunk 가 여러 개면 먼저 나온 행을 사용
+    candidates = np.flatnonzero(scores >= best[inverse])
+    _, first = np.unique(inverse[candidates], return_index=True)
+    rows = candidates[first]
+
+    if len(rows) > k:
+        rows = rows[np.argpartition(scores[rows], -k)[-k:]]
+    return rows[np.argsort(scores[rows])[::-1]]
+
+
+class ScoringEngine:
+    """chunk 벡터 캐시를 가진 cosine top-k 재정렬기 (asyncio.to_thread 에서 호출되므로 lock 사용)"""
+
+    def __init__(self, cache_size: int = SCORING_VECTOR_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # chunk id → unit float32 벡터
+        self._lock = threading.Lock()
+
+    def unit_vectors(self, chunk_ids, raw_vectors):
+        """(n, dim) 연속 float32 unit 벡터 버퍼. 캐시에 없는 벡터만 변환/정규화한다."""
+        cached, missing = {}, []
+        with self._lock:
+            for i, cid in enumerate(chunk_ids):
+                vec = self._cache.get(cid)
+                if vec is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(cid)
+                    cached[i] = vec
+
+        if missing:
+            fresh = np.asarray([raw_vectors[i] for i in missing], dtype=np.float32)
+            norms = np.linalg.norm(fresh, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            fresh /= norms
+            with self._lock:
+                for i, vec in zip(missing, fresh):
+                    # 행 view 를 넣으면 항목 하나가 batch 행렬 전체를 붙잡으므로 복사해서 보관
+                    self._cache[chunk_ids[i]] = vec.copy()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        dim = len(cached[next(iter(cached))]) if cached else fresh.shape[1]
+        buffer = np.empty((len(chunk_ids), dim), dtype=np.float32)
+        for i, vec in cached.items():
+            buffer[i] = vec
+        if missing:
+            buffer[missing] = fresh
+        return buffer
+
+    def rank(self, chunk_ids, doc_ids, raw_vectors, query_vector, k: int):
+        """cosine 점수로 doc_id 중복을 제거한 상위 k 개의 (행 번호, 점수) 반환"""
+        if not chunk_ids:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.unit_vectors(chunk_ids, raw_vectors) @ query
+        rows = top_unique(doc_ids, scores, k)
+        return [(int(i), float(scores[i])) for i in rows]
+
+
+engine = ScoringEngine()
@@ -1,23 +1,51 @@
-from elasticsearch import Elasticsearch
-from openai import OpenAI
 import numpy as np
 from dotenv import load_dotenv
-from config import ELASTIC_URL, ELASTIC_USER, ELASTIC_PASS, OPENAI_API_KEY
-from .model_loader import get_model
+from config import (
+    ELASTIC_SEARCH_TIMEOUT,
+    ELASTIC_FETCH_TIMEOUT,
+    SEARCH_RERANK_MODE,
+    SEARCH_CANDIDATES,
+    SEARCH_RESULT_SIZE,
+    VECTOR_INDEX_NPROBE,
+    VECTOR_INDEX_TOP_K,
+    JUDGEMENT_CACHE_BYTES,
+    JUDGEMENT_CACHE_TTL,
+    JUDGEMENT_CACHE_PATH,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL,
+    RETRIEVAL_DEADLINE,
+    RETRIEVAL_SUMMARY_TIMEOUT,
+    RETRIEVAL_FALLBACK_MIN,
+)
+from .cache import LRUCache, SqliteCache, SingleFlight
+from .embedding import encode_query, normalize_text
+from .llm_gateway import chat_completion
+from .es_client import get_es
+from .vector_index import get_vector_index
+from .scoring import engine, top_unique
+from .metrics import span
+from .resilience import deadline, remaining, within_deadline, es_call, degrade, track_degraded, ES_FAILURES
 import asyncio
 
 # 환경 변수 로드
 load_dotenv()
 
-# 클라이언트 초기화
-es = Elasticsearch(ELASTIC_URL, basic_auth=(ELASTIC_USER, ELASTIC_PASS), verify_certs=False)
-model = get_model()
-client = OpenAI(api_key=OPENAI_API_KEY)
+# 판결문 원문 캐시 (문서 길이 편차가 커서 항목 수가 아닌 바이트 기준으로 제한)
+# 키: (doc_id, max_chars), 디스크 계층은 JUDGEMENT_CACHE_PATH 를 줄 때만 사용
+_judgement_cache = LRUCache(ttl=JUDGEMENT_CACHE_TTL, max_bytes=JUDGEMENT_CACHE_BYTES)
+_judgement_disk = SqliteCache(JUDGEMENT_CACHE_PATH, JUDGEMENT_CACHE_TTL, 100000) if JUDGEMENT_CACHE_PATH else None
+
+# hybrid_search 결과 캐시 + 동시 동일 검색 합치기
+# 키: (정규화된 검색 요약문, 매핑된 도메인, k)
+_retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+_retrieval_flight = SingleFlight()
 
 # 필요한 index 및 vector_field 선언
 INDEX_CHUNK = "minsa_data"
 INDEX_FULL = "minsa_judgement"
 VECTOR_FIELD = "sentences_vector"
+# ES 재정렬 모드에서 받아올 필드 (벡터는 받지 않음)
+SEARCH_SOURCE_FIELDS = ["doc_id", "text"]
 
 # 도메인 키워드 → 인덱스 실제 값 매핑
 # 인덱스의 실제 값 집계 결과:
@@ -77,91 +105,227 @@ async def summarize_context_for_search(memory_context, latest_query):
     출력:
     """
 
-    res = client.chat.completions.create(
+    content = await chat_completion(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.2,
     )
-    return res.choices[0].message.content.strip()
+    return content.strip()
+
+
+# 1차 검색 요청 본문 생성
+# - client      : BM25 상위 SEARCH_CANDIDATES 건을 벡터 포함으로 받아 API 서버에서 cosine 재정렬
+# - rescore     : BM25 상위 SEARCH_CANDIDATES 건을 ES 안에서 script_score 로 재정렬
+# - knn         : domain 필터를 건 kNN 검색 (sentences_vector 인덱싱 필요)
+# - local       : BM25 는 ES, 의미 기반 후보/점수는 로컬 벡터 인덱스 (벡터는 받지 않음)
+def build_search_body(query: str, mapped_domain, query_vector=None, mode: str = SEARCH_RERANK_MODE):
+    domain_filter = {"term": {"domain": mapped_domain}} if mapped_domain else None
+
+    if mode == "knn":
+        knn = {
+            "field": VECTOR_FIELD,
+            "query_vector": query_vector,
+            "k": SEARCH_RESULT_SIZE,
+            "num_candidates": SEARCH_CANDIDATES,
+        }
+        if domain_filter:
+            knn["filter"] = domain_filter
+        return {"size": SEARCH_RESULT_SIZE, "_source": SEARCH_SOURCE_FIELDS, "knn": knn}
 
+    must_clauses = [{"match": {"text": query}}]
+    if domain_filter:
+        # domain 은 keyword 타입이므로 정확 일치 term 사용
+        must_clauses.insert(0, domain_filter)
+    bm25_query = {"bool": {"must": must_clauses}}
+
+    if mode == "local":
+        return {"size": SEARCH_CANDIDATES, "_source": SEARCH_SOURCE_FIELDS, "query": bm25_query}
+
+    if mode == "rescore":
+        # query_weight=0 이므로 최종 점수 = cosine + 1.0
+        return {
+            "size": SEARCH_RESULT_SIZE,
+            "_source": SEARCH_SOURCE_FIELDS,
+            "query": bm25_query,
+            "rescore": {
+                "window_size": SEARCH_CANDIDATES,
+                "query": {
+                    "rescore_query": {
+                        "script_score": {
+                            "query": {"match_all": {}},
+                            "script": {
+                                "source": f"cosineSimilarity(params.query_vector, '{VECTOR_FIELD}') + 1.0",
+                                "params": {"query_vector": query_vector},
+                            },
+                        }
+                    },
+                    "query_weight": 0.0,
+                    "rescore_query_weight": 1.0,
+                },
+            },
+        }
 
-# 하이브리드 검색 
-async def hybrid_search(query: str, domain_keyword: str, k: int = 5):
+    if mode != "client":
+        raise ValueError(f"알 수 없는 재정렬 모드: {mode!r}")
+    return {"size": SEARCH_CANDIDATES, "query": bm25_query}
 
-    # [1차 키워드 기반 검색] domain_keyword와 사용자 입력 query를 바탕으로 키워드 기반 1차 검색.
-    print(f"\n검색 시작: '{query}' | domain='{domain_keyword}'")
+# ES 점수를 client 모드와 같은 cosine 스케일로 변환
+def to_cosine(score: float, mode: str = SEARCH_RERANK_MODE):
+    if mode == "rescore":
+        return score - 1.0
+    if mode == "knn":
+        # cosine similarity 필드의 kNN 점수는 (1 + cosine) / 2
+        return score * 2.0 - 1.0
+    return score
 
+# 하이브리드 검색 
+# doc_id 중복을 제거한 상위 k 개의 (chunk source, cosine 점수)를 점수 내림차순으로 반환한다.
+# 같은 검색은 RETRIEVAL_CACHE_TTL 동안 캐시하고, 동시에 들어온 같은 검색은 한 번만 실행한다.
+# 반환하는 source 에는 벡터 필드(VECTOR_FIELD)가 없다.
+async def hybrid_search(query: str, domain_keyword: str, k: int = 5):
     # UI/외부에서 들어온 도메인을 인덱스의 실제 값으로 정규화
     mapped_domain = DOMAIN_MAP.get(domain_keyword, domain_keyword)
+    key = (normalize_text(query), mapped_domain, k)
 
-    must_clauses = [{"match": {"text": query}}]
-    if mapped_domain:
-        # domain 은 keyword 타입이므로 정확 일치 term 사용
-        must_clauses.insert(0, {"term": {"domain": mapped_domain}})
-
-    bm25_query = {
-        "size": 500,
-        "query": {
-            "bool": {
-                "must": must_clauses
-            }
-        }
-    }
+    results = _retrieval_cache.get(key)
+    if results is not None:
+        print(f"[검색 캐시] 적중: '{query}' | domain='{mapped_domain}'")
+        return list(results)
 
-    keyword_result = await asyncio.to_thread(
-        es.search, index=INDEX_CHUNK, body=bm25_query
-    )
-    hits = keyword_result["hits"]["hits"]
+    async def search():
+        with track_degraded() as degraded:
+            results = await _hybrid_search(query, mapped_domain, k)
+        # 벡터는 이후 단계에서 쓰지 않으므로 빼고 보관 (client 모드 _source 의 768 차원 리스트)
+        results = [({f: v for f, v in src.items() if f != VECTOR_FIELD}, score) for src, score in results]
+        # 빈 결과나 마감 시간 때문에 품질을 낮춘 결과는 그 요청만의 일시적 상태이므로 캐시하지 않음
+        if results and not degraded:
+            _retrieval_cache.set(key, tuple(results))
+        return results
 
-    if not hits:
-        # 도메인 필터가 원인일 수 있으므로 도메인 없이 재시도
-        if mapped_domain:
-            print("[1차 키워드 기반 검색] 도메인 필터 0건 → 도메인 없이 재시도")
-            fallback_query = {
-                "size": 500,
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"match": {"text": query}}
-                        ]
-                    }
-                }
-            }
-            keyword_result = await asyncio.to_thread(
-                es.search, index=INDEX_CHUNK, body=fallback_query
-            )
-            hits = keyword_result["hits"]["hits"]
+    return list(await _retrieval_flight.do(key, search))
 
-        if not hits:
-            print("[1차 키워드 기반 검색] 결과 없음")
-            return []
+async def _hybrid_search(query: str, mapped_domain, k: int):
 
-    print(f"[1차 키워드 기반 검색] 문서 수: {len(hits)}")
+    # [1차 키워드 기반 검색] domain_keyword와 사용자 입력 query를 바탕으로 키워드 기반 1차 검색.
+    mode = SEARCH_RERANK_MODE
+    print(f"\n검색 시작: '{query}' | domain='{mapped_domain}' | mode='{mode}'")
+
+    if mode == "local":
+        index = get_vector_index(mapped_domain)
+        if index is not None:
+            return await local_hybrid_search(query, mapped_domain, index, k)
+        print(f"[로컬 벡터 인덱스] '{mapped_domain}' 인덱스 없음 → client 모드로 검색")
+        mode = "client"
+
+    # ES 재정렬 모드는 질의 벡터가 검색 요청에 필요하므로 먼저 인코딩하고,
+    # client 모드는 BM25 검색과 질의 인코딩이 서로 독립적이므로 동시에 진행
+    query_vector, vector_task = None, None
+    if mode == "client":
+        vector_task = asyncio.create_task(encode_query(query))
+    else:
+        query_vector = (await within_deadline(encode_query(query))).tolist()
+
+    try:
+        body = build_search_body(query, mapped_domain, query_vector, mode)
+        keyword_result = await _bm25_search(body)
+        hits = keyword_result["hits"]["hits"]
+
+        if not hits and mapped_domain:
+            left = remaining()
+            if left is not None and left < RETRIEVAL_FALLBACK_MIN:
+                # 마감이 가까우면 재검색하지 않고 결과 없음으로 처리
+                print(f"[1차 키워드 기반 검색] 도메인 필터 0건, 남은 시간 {left:.2f}초 → 재검색 생략")
+                degrade("fallback_search")
+            else:
+                # 도메인 필터가 원인일 수 있으므로 도메인 없이 재시도
+                print("[1차 키워드 기반 검색] 도메인 필터 0건 → 도메인 없이 재시도")
+                fallback_body = build_search_body(query, None, query_vector, mode)
+                keyword_result = await _bm25_search(fallback_body)
+                hits = keyword_result["hits"]["hits"]
+    except BaseException:
+        if vector_task is not None:
+            vector_task.cancel()
+        raise
 
-    # [2차 의미 기반 검색] cosine 유사도를 기반으로 의미가 유사한 문서를 상위권으로 랭크.
-    query_vector = await asyncio.to_thread(model.encode, query)
+    if not hits:
+        print("[1차 키워드 기반 검색] 결과 없음")
+        if vector_task is not None:
+            vector_task.cancel()
+        return []
+
+    print(f"[1차 키워드 기반 검색] 문서 수: {len(hits)}")
 
-    docs, embeddings = [], []
+    if mode != "client":
+        # ES 가 이미 의미 기반 점수로 정렬해서 반환하므로 doc_id 중복만 제거
+        hits = [hit for hit in hits if hit["_source"].get("doc_id")]
+        scores = np.array([hit["_score"] for hit in hits], dtype=np.float32)
+        rows = top_unique([hit["_source"]["doc_id"] for hit in hits], scores, k)
+        results = [(hits[i]["_source"], to_cosine(float(scores[i]), mode)) for i in rows]
+        print(f"[2차 의미 기반 검색] 고유 문서 수: {len(results)} (ES {mode})")
+        return results
 
-    for hit in hits:
-        src = hit["_source"]
-        vec = src.get(VECTOR_FIELD)
-        if vec is not None:
-            docs.append(src)
-            embeddings.append(vec)
+    # [2차 의미 기반 검색] cosine 유사도를 기반으로 의미가 유사한 문서를 상위권으로 랭크.
+    query_vector = await within_deadline(vector_task)
+
+    hits = [
+        hit for hit in hits
+        if hit["_source"].get(VECTOR_FIELD) is not None and hit["_source"].get("doc_id")
+    ]
+    with span("rerank"):
+        ranked = await asyncio.to_thread(
+            engine.rank,
+            [hit["_id"] for hit in hits],
+            [hit["_source"]["doc_id"] for hit in hits],
+            [hit["_source"][VECTOR_FIELD] for hit in hits],
+            query_vector,
+            k,
+        )
+    results = [(hits[i]["_source"], score) for i, score in ranked]
+
+    print(f"[2차 의미 기반 검색] 고유 문서 수: {len(results)}")
+    return results
 
-    embeddings = np.array(embeddings)
-    scores = await asyncio.to_thread(
-        lambda: np.dot(embeddings, query_vector)
-        / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_vector))
+# 로컬 벡터 인덱스 기반 하이브리드 검색
+# ES 에는 BM25 만 요청하고(벡터 제외), 같은 시간에 질의를 인코딩한다.
+# BM25 후보는 로컬 벡터로 점수를 매기고, ANN 으로 찾은 의미 기반 후보를 합쳐 정렬한다.
+# 로컬 인덱스가 도메인 후보를 항상 주므로 도메인 없는 재검색은 하지 않는다.
+async def local_hybrid_search(query: str, mapped_domain: str, index, k: int = 5):
+    body = build_search_body(query, mapped_domain, mode="local")
+    query_vector, keyword_result = await asyncio.gather(
+        within_deadline(encode_query(query)),
+        _bm25_search(body),
     )
+    hits = keyword_result["hits"]["hits"]
+    print(f"[1차 키워드 기반 검색] 문서 수: {len(hits)}")
 
-    top_indices = np.argsort(scores)[::-1]
-    results = [(docs[i], float(scores[i])) for i in top_indices]
-
-    print(f"[2차 의미 기반 검색] 문서 수: {len(results)}")
+    def rank():
+        bm25_rows, bm25_scores = index.score_chunks([hit["_id"] for hit in hits], query_vector)
+        ann_rows, ann_scores = index.search(query_vector, VECTOR_INDEX_TOP_K, VECTOR_INDEX_NPROBE)
+        rows, first = np.unique(np.concatenate([bm25_rows, ann_rows]), return_index=True)
+        scores = np.concatenate([bm25_scores, ann_scores])[first]
+        top = top_unique(index.doc_ids[rows], scores, k)
+        return rows[top], scores[top]
+
+    with span("rerank"):
+        rows, scores = await asyncio.to_thread(rank)
+    sources = {hit["_id"]: hit["_source"] for hit in hits}
+    results = []
+    for row, score in zip(rows, scores):
+        chunk_id = str(index.chunk_ids[row])
+        src = sources.get(chunk_id) or {"doc_id": str(index.doc_ids[row])}
+        results.append((src, float(score)))
+
+    print(f"[2차 의미 기반 검색] 고유 문서 수: {len(results)} (로컬 인덱스)")
     return results
 
+# ES 검색 요청은 마감 시간 / 서킷 브레이커 / 헤징을 거친다 (services/resilience.py)
+async def _bm25_search(body):
+    def request(timeout):
+        return get_es().options(request_timeout=timeout).search(index=INDEX_CHUNK, body=body)
+
+    with span("bm25"):
+        return await es_call("search", request, ELASTIC_SEARCH_TIMEOUT)
+
 # 중복 doc_id 제거 및 상위 N개 선택
 # 하나의 문서가 chunk 단위로 나눠져 있기 때문에 중복된 doc_id가 검색 결과로 매치될 수 있다.
 # 가장 점수가 높은 chuck를 바탕으로 중복 id를 제거하고 상위 N개를 선택한다.
@@ -180,23 +344,146 @@ def get_unique_docs(results, top_n=3):
     print(f"고유 doc_id {len(unique_results)}개 선택 완료: {seen_ids}")
     return unique_results
 
+class RetrievalUnavailable(Exception):
+    """마감 시간 안에 판례 검색을 끝내지 못함 (ES 지연/장애, 서킷 open)"""
+
+# 판례 검색 전체 단계 (검색 요약 → 하이브리드 검색 → 원문 일괄 조회)
+# advising_agent 와 파이프라인의 투기적 실행이 함께 사용한다.
+# 반환값: [{"doc_id", "score", "text"}] (검색 결과 자체가 없으면 None)
+# 전체를 RETRIEVAL_DEADLINE 안에 끝내며, 늦어지는 단계는 품질을 낮춰 진행한다.
+# - 요약 지연 → 사용자 발화를 그대로 검색어로 사용
+# - 원문 조회 실패 → 검색된 chunk 문장으로 대신 (chunk 문장이 없으면 그 판례는 제외)
+# - 검색 자체 실패 → RetrievalUnavailable (advising_agent 가 일반 상담으로 답변)
+async def retrieve_precedents(memory_context, latest_query: str, domain: str, top_n: int = 3, max_chars: int = 1200):
+    with deadline(RETRIEVAL_DEADLINE):
+        # 요약 문장 생성
+        try:
+            with span("search_summary"):
+                summary = await within_deadline(
+                    summarize_context_for_search(memory_context, latest_query), RETRIEVAL_SUMMARY_TIMEOUT
+                )
+        except asyncio.TimeoutError:
+            print("[판례 검색] 검색 요약 지연 → 사용자 발화로 검색")
+            degrade("summary")
+            summary = latest_query
+        print(f"검색 요약: {summary}")
+
+        # RAG 검색
+        try:
+            results = await hybrid_search(summary, domain)
+        except ES_FAILURES as e:
+            print(f"[판례 검색] 검색 실패 : {type(e).__name__} - {e}")
+            degrade("unavailable")
+            raise RetrievalUnavailable(type(e).__name__) from e
+        if not results:
+            return None
+
+        # 중복 제거 후 상위 N개만 추출
+        unique_docs = get_unique_docs(results, top_n=top_n)
+
+        # 판례 원문 가져오기 (msearch 한 번으로 일괄 조회)
+        try:
+            with span("fetch"):
+                texts = await fetch_full_texts([doc["doc_id"] for doc, _ in unique_docs], max_chars=max_chars)
+        except ES_FAILURES as e:
+            print(f"[판례 검색] 원문 조회 실패 ({type(e).__name__}) → 검색된 chunk 문장으로 대신")
+            degrade("fetch")
+            texts = {doc["doc_id"]: doc["text"][:max_chars] for doc, _ in unique_docs if doc.get("text")}
+
+    return [
+        {
+            "doc_id": doc["doc_id"],
+            "score": score,
+            "text": texts[doc["doc_id"]]
+        }
+        for doc, score in unique_docs
+        if texts.get(doc["doc_id"])
+    ]
+
 # 원문 조회
 # chuck에서 가져온 doc_id를 바탕으로 판결문 원문을 조회한다.
 # doc_id는 text 타입이므로 keyword 서브필드를 사용해야 정확 일치 검색이 가능함
-async def fetch_full_text(doc_id):
-    query = {"query": {"term": {"doc_id.keyword": doc_id}}}
-    res = await asyncio.to_thread(es.search, index=INDEX_FULL, body=query)
-
-    if not res["hits"]["hits"]:
-        print(f"{doc_id} not found in {INDEX_FULL}")
+async def fetch_full_text(doc_id, max_chars: int = None):
+    texts = await fetch_full_texts([doc_id], max_chars)
+    return texts.get(doc_id)
+
+# 여러 판결문 원문을 캐시에서 찾고, 없는 것만 msearch 한 번으로 조회한다.
+# sentences 필드만 받아오고, max_chars 를 주면 그 길이까지만 이어 붙인다.
+# 반환값: {doc_id: text} (찾지 못한 doc_id 는 빠짐)
+async def fetch_full_texts(doc_ids, max_chars: int = None):
+    texts = {}
+    missing = []
+    for doc_id in dict.fromkeys(doc_ids):
+        text = _judgement_cache.get((doc_id, max_chars))
+        if text is None and _judgement_disk is not None:
+            raw = await asyncio.to_thread(_judgement_disk.get, f"{max_chars}|{doc_id}")
+            if raw is not None:
+                text = raw.decode("utf-8")
+                _judgement_cache.set((doc_id, max_chars), text)
+        if text is not None:
+            texts[doc_id] = text
+        else:
+            missing.append(doc_id)
+
+    if missing:
+        fetched = await _msearch_full_texts(missing, max_chars)
+        for doc_id, text in fetched.items():
+            _judgement_cache.set((doc_id, max_chars), text)
+            if _judgement_disk is not None:
+                await asyncio.to_thread(_judgement_disk.set, f"{max_chars}|{doc_id}", text.encode("utf-8"))
+        texts.update(fetched)
+    return texts
+
+async def _msearch_full_texts(doc_ids, max_chars: int = None):
+    searches = []
+    for doc_id in doc_ids:
+        searches.append({"index": INDEX_FULL})
+        searches.append({
+            "size": 1,
+            "_source": ["sentences"],
+            "query": {"term": {"doc_id.keyword": doc_id}},
+        })
+
+    def request(timeout):
+        return get_es().options(request_timeout=timeout).msearch(searches=searches)
+
+    res = await es_call("msearch", request, ELASTIC_FETCH_TIMEOUT)
+
+    texts = {}
+    for doc_id, response in zip(doc_ids, res["responses"]):
+        hits = response.get("hits", {}).get("hits", [])
+        if not hits:
+            print(f"{doc_id} not found in {INDEX_FULL} {response.get('error', '')}")
+            continue
+        text = join_sentences(hits[0]["_source"].get("sentences"), max_chars)
+        if text:
+            texts[doc_id] = text
+    return texts
+
+def join_sentences(sentences, max_chars: int = None):
+    if isinstance(sentences, str):
+        text = sentences.strip()
+    elif isinstance(sentences, list):
+        if max_chars is None:
+            text = "\n".join(sentences)
+        else:
+            # 필요한 길이만큼만 이어 붙임
+            parts, length = [], 0
+            for sentence in sentences:
+                parts.append(sentence)
+                length += len(sentence) + 1
+                if length >= max_chars:
+                    break
+            text = "\n".join(parts)
+    else:
         return None
+    return text[:max_chars] if max_chars is not None else text
 
-    src = res["hits"]["hits"][0]["_source"]
-    sentences = src.get("sentences")
+def retrieval_cache_stats():
+    return {"memory": _retrieval_cache.stats(), "singleflight": _retrieval_flight.stats()}
 
-    if isinstance(sentences, list):
-        return "\n".join(sentences)
-    elif isinstance(sentences, str):
-        return sentences.strip()
-    else:
-        return None
+def judgement_cache_stats():
+    stats = {"memory": _judgement_cache.stats()}
+    if _judgement_disk is not None:
+        stats["disk"] = _judgement_disk.stats()
+    return stats
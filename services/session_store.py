@@ -0,0 +1,172 @@
+# 워커/노드 간 공유 세션 저장소
+# MemoryManager 는 워커별 로컬 캐시로 두고, 턴 시작 시 저장소에서 최신 상태를 읽고
+# 턴 종료 시 version 비교(optimistic concurrency)로 저장한다.
+# - local : 공유 저장소 없음 (단일 워커, 기본값)
+# - memory: 프로세스 내 저장소 (버전 충돌 처리 경로 확인용)
+# - sqlite: WAL 모드 sqlite 파일 (같은 볼륨을 공유하는 여러 워커)
+# ttl(기본: MemoryManager 의 유휴 TTL) 동안 저장되지 않은 세션은 만료되어 저장된 적 없는 세션처럼 취급하고,
+# 저장할 때 SWEEP_INTERVAL 마다 만료된 세션을 지운다.
+import json, time, sqlite3, threading, asyncio
+from abc import ABC, abstractmethod
+from config import SESSION_STORE, SESSION_STORE_PATH, SESSION_IDLE_TTL
+
+# 만료된 세션을 정리하는 최소 간격(초)
+SWEEP_INTERVAL = 60
+
+
+def dump_state(state: dict):
+    return json.dumps(state, ensure_ascii=False)
+
+
+def load_state(data: str):
+    return json.loads(data)
+
+
+class SessionStore(ABC):
+    """세션 상태 저장소 인터페이스
+    - state: {"messages": [[type, content], ...], "mode", "info_rounds", "summary", "summarized"}
+    - version 0 은 저장된 적 없거나 만료/삭제된 세션입니다.
+    """
+
+    @abstractmethod
+    async def version(self, conv_idx: str) -> int:
+        ...
+
+    @abstractmethod
+    async def load(self, conv_idx: str):
+        """(state | None, version)"""
+
+    @abstractmethod
+    async def save(self, conv_idx: str, state: dict, expected_version: int) -> bool:
+        """저장된 version 이 expected_version 일 때만 저장하고 version 을 1 올린다."""
+
+    @abstractmethod
+    async def delete(self, conv_idx: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, ttl: float = SESSION_IDLE_TTL):
+        self.ttl = ttl
+        self._data = {}  # conv_idx → (version, state, 저장 시각)
+        self._swept = time.monotonic()
+
+    def _get(self, conv_idx):
+        item = self._data.get(conv_idx)
+        if item is not None and time.monotonic() - item[2] > self.ttl:
+            del self._data[conv_idx]
+            return None
+        return item
+
+    def _sweep(self, now):
+        if now - self._swept < SWEEP_INTERVAL:
+            return
+        self._swept = now
+        for conv_idx in [c for c, item in self._data.items() if now - item[2] > self.ttl]:
+            del self._data[conv_idx]
+
+    async def version(self, conv_idx):
+        item = self._get(conv_idx)
+        return item[0] if item else 0
+
+    async def load(self, conv_idx):
+        item = self._get(conv_idx)
+        return (item[1], item[0]) if item else (None, 0)
+
+    async def save(self, conv_idx, state, expected_version):
+        item = self._get(conv_idx)
+        if (item[0] if item else 0) != expected_version:
+            return False
+        now = time.monotonic()
+        self._data[conv_idx] = (expected_version + 1, state, now)
+        self._sweep(now)
+        return True
+
+    async def delete(self, conv_idx):
+        self._data.pop(conv_idx, None)
+
+
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path: str, ttl: float = SESSION_IDLE_TTL):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " conv_idx TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL, updated_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._swept = time.time()
+
+    def _version(self, conv_idx):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM sessions WHERE conv_idx = ? AND updated_at >= ?",
+                (conv_idx, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, conv_idx):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version FROM sessions WHERE conv_idx = ? AND updated_at >= ?",
+                (conv_idx, time.time() - self.ttl),
+            ).fetchone()
+        return (load_state(row[0]), row[1]) if row else (None, 0)
+
+    def _save(self, conv_idx, data, expected_version):
+        now = time.time()
+        with self._lock:
+            if expected_version == 0:
+                # 만료된 행은 저장된 적 없는 세션으로 보고 덮어쓴다
+                cursor = self._conn.execute(
+                    "INSERT INTO sessions (conv_idx, version, data, updated_at) VALUES (?, 1, ?, ?)"
+                    " ON CONFLICT(conv_idx) DO UPDATE SET version = 1, data = excluded.data,"
+                    " updated_at = excluded.updated_at WHERE sessions.updated_at < ?",
+                    (conv_idx, data, now, now - self.ttl),
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE sessions SET version = version + 1, data = ?, updated_at = ?"
+                    " WHERE conv_idx = ? AND version = ? AND updated_at >= ?",
+                    (data, now, conv_idx, expected_version, now - self.ttl),
+                )
+            saved = cursor.rowcount == 1
+            if now - self._swept >= SWEEP_INTERVAL:
+                self._swept = now
+                self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+            self._conn.commit()
+            return saved
+
+    def _delete(self, conv_idx):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE conv_idx = ?", (conv_idx,))
+            self._conn.commit()
+
+    async def version(self, conv_idx):
+        return await asyncio.to_thread(self._version, conv_idx)
+
+    async def load(self, conv_idx):
+        return await asyncio.to_thread(self._load, conv_idx)
+
+    async def save(self, conv_idx, state, expected_version):
+        return await asyncio.to_thread(self._save, conv_idx, dump_state(state), expected_version)
+
+    async def delete(self, conv_idx):
+        await asyncio.to_thread(self._delete, conv_idx)
+
+    async def close(self):
+        self._conn.close()
+
+
+def create_session_store(kind: str = SESSION_STORE, ttl: float = SESSION_IDLE_TTL):
+    if kind == "sqlite":
+        return SqliteSessionStore(SESSION_STORE_PATH, ttl)
+    if kind == "memory":
+        return InMemorySessionStore(ttl)
+    return None
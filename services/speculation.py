@@ -0,0 +1,54 @@
+# 투기적(speculative) 판례 검색
+# free_chat 상태에서 mode_classifier 가 도는 동안, 발화가 판례 조언을 원하는 것처럼 보이면
+# 검색 요약 + 하이브리드 검색 + 원문 조회를 미리 시작한다.
+# 분류 결과가 advising 이면 그 결과를 그대로 쓰고, 아니면 취소한다.
+import asyncio
+from config import SPECULATIVE_RETRIEVAL
+from .searching import retrieve_precedents
+
+# 판례/조언 요청으로 볼 만한 표현
+ADVISING_HINTS = (
+    "판례", "판결", "사례", "비슷한", "유사한", "조언", "승소", "패소",
+    "가능성", "과실비율", "손해배상", "받을 수 있", "어떻게 되",
+)
+
+# 비용 확인용 통계
+# - started  : 시작한 투기적 검색 수
+# - used     : advising 으로 분류되어 결과를 사용한 수
+# - cancelled: 진행 중에 취소한 수 (요약 LLM 호출 일부가 낭비됨)
+# - wasted   : 이미 끝났지만 버린 수 (요약 LLM 호출 + 검색 전체가 낭비됨)
+speculation_stats = {"started": 0, "used": 0, "cancelled": 0, "wasted": 0}
+
+
+def looks_like_advising(query: str):
+    return any(hint in query for hint in ADVISING_HINTS)
+
+
+class Speculation:
+    """미리 시작한 retrieve_precedents task"""
+
+    def __init__(self, memory_context, query: str, domain: str):
+        self.task = asyncio.create_task(retrieve_precedents(memory_context, query, domain))
+        speculation_stats["started"] += 1
+
+    def claim(self):
+        """분류 결과가 advising 일 때 결과 task 를 넘겨받는다."""
+        speculation_stats["used"] += 1
+        return self.task
+
+    def cancel(self):
+        if self.task.done():
+            speculation_stats["wasted"] += 1
+            if not self.task.cancelled():
+                self.task.exception()  # 미회수 예외 경고 방지
+        else:
+            self.task.cancel()
+            speculation_stats["cancelled"] += 1
+
+
+def maybe_speculate(memory_context, query: str, domain: str):
+    """설정이 켜져 있고 조언 요청으로 보이면 투기적 검색을 시작한다."""
+    if SPECULATIVE_RETRIEVAL and looks_like_advising(query):
+        print("[SPECULATIVE] 모드 분류와 동시에 판례 검색 시작")
+        return Speculation(memory_context, query, domain)
+    return None
@@ -0,0 +1,65 @@
+# LLM 토큰 스트림을 SSE 프레임으로 묶어 보내는 writer
+# - 토큰마다 json.dumps + 프레임을 만드는 대신 정책(SSE_FLUSH_POLICY)에 따라 여러 토큰을 한 프레임으로 합친다.
+# - 프레임 모양은 그대로 {"token": ...} / {"full": ...} 이므로 클라이언트는 token 을 이어 붙이기만 하면 된다.
+# - 첫 토큰은 바로 보내 TTFT 를 늘리지 않는다. 시간 간격은 다음 토큰이 도착할 때 확인하고,
+#   상류가 멈추면 stream_response 가 flush_timeout() 만큼만 기다린 뒤 남은 토큰을 보낸다.
+import json
+import time
+from config import SSE_FLUSH_POLICY, SSE_FLUSH_MS, SSE_FLUSH_BYTES
+
+sse_stats = {"streams": 0, "tokens": 0, "frames": 0}
+
+
+def sse_event(payload) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class TokenWriter:
+    def __init__(self, policy: str = SSE_FLUSH_POLICY, interval_ms: float = SSE_FLUSH_MS,
+                 max_bytes: int = SSE_FLUSH_BYTES):
+        self.policy = policy
+        self.interval = interval_ms / 1000
+        self.max_bytes = max_bytes
+        self.parts = []          # 전체 응답 (마지막에 한 번만 join)
+        self.pending = []        # 아직 보내지 않은 토큰
+        self.pending_bytes = 0
+        self.last_flush = None   # 첫 토큰은 바로 전송
+        sse_stats["streams"] += 1
+
+    def push(self, token: str):
+        """토큰 추가. 정책상 보낼 때가 되면 SSE 프레임을, 아니면 None 을 반환"""
+        if not token:
+            return None
+        self.parts.append(token)
+        self.pending.append(token)
+        sse_stats["tokens"] += 1
+
+        if self.policy == "bytes":
+            self.pending_bytes += len(token.encode("utf-8"))
+            due = self.last_flush is None or self.pending_bytes >= self.max_bytes
+        elif self.policy == "ms":
+            due = self.last_flush is None or time.monotonic() - self.last_flush >= self.interval
+        else:
+            due = True
+        return self.flush() if due else None
+
+    def flush_timeout(self):
+        """ms 정책에서 남은 토큰을 보내야 할 때까지의 시간(초). 기다릴 토큰이 없거나 다른 정책이면 None"""
+        if self.policy != "ms" or not self.pending:
+            return None
+        return max(0.0, self.last_flush + self.interval - time.monotonic())
+
+    def flush(self):
+        """남은 토큰을 한 프레임으로 반환 (없으면 None)"""
+        if not self.pending:
+            return None
+        text = "".join(self.pending)
+        self.pending.clear()
+        self.pending_bytes = 0
+        self.last_flush = time.monotonic()
+        sse_stats["frames"] += 1
+        return sse_event({"token": text})
+
+    @property
+    def full(self) -> str:
+        return "".join(self.parts)
@@ -0,0 +1,289 @@
+# minsa_data chunk 임베딩의 로컬 벡터 인덱스
+# 도메인별로 unit-normalize 된 임베딩 행렬(float32 또는 int8)과 chunk/doc id 배열을 .npy 로 저장하고,
+# np.load(mmap_mode="r") 로 열어 여러 uvicorn 워커가 같은 페이지를 공유한다.
+# 도메인 디렉터리 안에 버전별 디렉터리(v<ns>)를 만들고 CURRENT 포인터 파일을 os.replace 로 교체하므로,
+# 읽는 워커는 포인터를 한 번 읽어 정한 버전을 끝까지 읽는다 (교체 중에도 인덱스가 사라지는 순간이 없음).
+# ANN 구조는 IVF(spherical k-means centroid + centroid 별로 연속 배치된 벡터)이다.
+#
+# 사용법:
+#   python -m services.vector_index build [--dtype int8] [--nlist 256]   # ES 에서 전체 스냅샷
+#   python -m services.vector_index refresh                              # 추가/삭제된 chunk 만 반영
+import os, json, time, shutil, argparse, asyncio
+import numpy as np
+from config import VECTOR_INDEX_DIR, VECTOR_INDEX_DTYPE
+
+INT8_SCALE = 127.0
+RELOAD_CHECK_SEC = 60  # refresh 로 파일이 교체됐는지 확인하는 주기
+POINTER_FILE = "CURRENT"  # 현재 버전 디렉터리 이름을 담은 파일
+
+_indexes = {}  # domain → (VectorIndex | None, 마지막 확인 시각)
+
+
+def domain_dir(domain: str):
+    """도메인 값(예: 부동산/임대차)을 디렉터리 경로로 변환"""
+    return os.path.join(VECTOR_INDEX_DIR, domain.replace("/", "_"))
+
+
+def current_path(path: str):
+    """도메인 디렉터리의 현재 버전 경로 (CURRENT 포인터가 없으면 None)"""
+    try:
+        with open(os.path.join(path, POINTER_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(path, version) if version else None
+
+
+def normalize(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """도메인 하나의 mmap 임베딩 행렬 + IVF 구조 (path: 버전 디렉터리)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.chunk_ids = np.load(os.path.join(path, "chunk_ids.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.scale = 1.0 / INT8_SCALE if self.meta["dtype"] == "int8" else 1.0
+        self._row_of = None
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def row_of(self):
+        """chunk id → 행 번호 (BM25 결과 조회용, 처음 쓸 때 생성)"""
+        if self._row_of is None:
+            self._row_of = {str(cid): i for i, cid in enumerate(self.chunk_ids)}
+        return self._row_of
+
+    def dense(self, rows=None):
+        """저장된 벡터를 float32 로 복원"""
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        return np.asarray(vectors, dtype=np.float32) * self.scale
+
+    def search(self, query_vector, top_k: int, nprobe: int):
+        """ANN 검색: 가까운 nprobe 개 리스트만 스캔해 (행 번호, cosine) 상위 top_k 반환"""
+        q = normalize(query_vector)
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(self.centroids @ q, -nprobe)[-nprobe:]
+
+        rows, scores = [], []
+        for c in probe:
+            start, end = int(self.offsets[c]), int(self.offsets[c + 1])
+            if start == end:
+                continue
+            rows.append(np.arange(start, end))
+            scores.append(self.dense(slice(start, end)) @ q)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        if len(scores) > top_k:
+            top = np.argpartition(scores, -top_k)[-top_k:]
+            rows, scores = rows[top], scores[top]
+        return rows, scores
+
+    def score_chunks(self, chunk_ids, query_vector):
+        """BM25 로 찾은 chunk 들의 cosine 점수 (인덱스에 없는 chunk 는 제외)"""
+        row_of = self.row_of()
+        rows = np.array([row_of[cid] for cid in chunk_ids if cid in row_of], dtype=np.int64)
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        return rows, self.dense(rows) @ normalize(query_vector)
+
+
+def get_vector_index(domain):
+    """도메인 인덱스가 있으면 mmap 으로 열어 재사용하고, refresh 로 교체되면 다시 연다."""
+    if not domain:
+        return None
+    now = time.monotonic()
+    index, checked_at = _indexes.get(domain, (None, 0.0))
+    if now - checked_at < RELOAD_CHECK_SEC:
+        return index
+
+    path = current_path(domain_dir(domain))
+    if path is None:
+        index = None
+    elif index is None or index.path != path:
+        try:
+            index = VectorIndex(path)
+        except OSError as e:
+            # 읽는 사이 연속된 refresh 로 그 버전이 정리된 경우: 기존 인덱스를 쓰고 다음 호출에서 다시 확인
+            print(f"[로컬 벡터 인덱스] '{domain}' 로드 실패 ({type(e).__name__}) → 기존 인덱스 유지")
+            return index
+        print(f"[로컬 벡터 인덱스] '{domain}' 로드 ({len(index)}건, {index.meta['dtype']})")
+    _indexes[domain] = (index, now)
+    return index
+
+
+# ---------------------------------------------------------------------------
+# 인덱스 생성 / 갱신
+# ---------------------------------------------------------------------------
+
+def spherical_kmeans(vectors, nlist: int, iters: int = 10, sample: int = 50000, seed: int = 0):
+    """unit 벡터용 k-means (샘플에서 centroid 학습)"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+def assign_lists(vectors, centroids, batch: int = 8192):
+    return np.concatenate([
+        np.argmax(vectors[i:i + batch] @ centroids.T, axis=1)
+        for i in range(0, len(vectors), batch)
+    ])
+
+
+def write_index(path: str, chunk_ids, doc_ids, vectors, dtype: str, nlist=None, centroids=None):
+    """임베딩을 IVF 순서로 정렬해 새 버전 디렉터리에 저장한 뒤 CURRENT 포인터를 원자적으로 교체한다.
+    직전 버전은 포인터를 막 읽은 워커가 아직 열고 있을 수 있으므로 남기고, 그보다 오래된 버전만 지운다."""
+    vectors = normalize(vectors)
+    if centroids is None:
+        nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        centroids = spherical_kmeans(vectors, min(nlist, len(vectors)))
+
+    assign = assign_lists(vectors, centroids)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+    vectors = vectors[order]
+    if dtype == "int8":
+        vectors = np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+
+    previous = current_path(path)
+    version = f"v{time.time_ns()}"
+    version_path = os.path.join(path, version)
+    os.makedirs(version_path)
+    np.save(os.path.join(version_path, "vectors.npy"), vectors)
+    np.save(os.path.join(version_path, "chunk_ids.npy"), np.asarray(chunk_ids, dtype=str)[order])
+    np.save(os.path.join(version_path, "doc_ids.npy"), np.asarray(doc_ids, dtype=str)[order])
+    np.save(os.path.join(version_path, "centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(version_path, "offsets.npy"), offsets.astype(np.int64))
+    with open(os.path.join(version_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "dtype": dtype,
+            "count": int(len(vectors)),
+            "dim": int(vectors.shape[1]),
+            "nlist": int(len(centroids)),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, f, ensure_ascii=False)
+
+    pointer_tmp = os.path.join(path, POINTER_FILE + ".tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(path, POINTER_FILE))
+
+    keep = {version, os.path.basename(previous) if previous else None}
+    for name in os.listdir(path):
+        if name.startswith("v") and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+async def build(dtype: str = VECTOR_INDEX_DTYPE, nlist=None):
+    """minsa_data 전체를 스캔해 도메인별 인덱스를 새로 만든다."""
+    from elasticsearch.helpers import async_scan
+    from .es_client import get_es
+    from .searching import INDEX_CHUNK, VECTOR_FIELD
+
+    chunks = {}  # domain → (chunk_ids, doc_ids, vectors)
+    async for hit in async_scan(
+        get_es(),
+        index=INDEX_CHUNK,
+        query={"query": {"match_all": {}}},
+        _source=["domain", "doc_id", VECTOR_FIELD],
+    ):
+        src = hit["_source"]
+        if not src.get("domain") or src.get(VECTOR_FIELD) is None:
+            continue
+        ids, docs, vecs = chunks.setdefault(src["domain"], ([], [], []))
+        ids.append(hit["_id"])
+        docs.append(src.get("doc_id", ""))
+        vecs.append(src[VECTOR_FIELD])
+
+    for domain, (ids, docs, vecs) in chunks.items():
+        write_index(domain_dir(domain), ids, docs, np.array(vecs, dtype=np.float32), dtype, nlist)
+        print(f"[로컬 벡터 인덱스] '{domain}' 생성 완료 ({len(ids)}건)")
+
+
+async def refresh(dtype: str = None):
+    """추가된 chunk 는 가져와 붙이고 삭제된 chunk 는 뺀다. centroid 는 기존 것을 재사용한다.
+    dtype 을 주지 않으면 기존 인덱스의 dtype 을 유지한다."""
+    from elasticsearch.helpers import async_scan
+    from .es_client import get_es
+    from .searching import INDEX_CHUNK, VECTOR_FIELD
+
+    es = get_es()
+    live_chunks = {}  # domain → 현재 ES 의 chunk id 집합
+    async for hit in async_scan(es, index=INDEX_CHUNK, query={"query": {"match_all": {}}}, _source=["domain"]):
+        domain = hit["_source"].get("domain")
+        if domain:
+            live_chunks.setdefault(domain, set()).add(hit["_id"])
+
+    for domain, live_ids in live_chunks.items():
+        path = domain_dir(domain)
+        current = current_path(path)
+        if current is None:
+            print(f"[로컬 벡터 인덱스] '{domain}' 인덱스 없음 → build 를 먼저 실행하세요")
+            continue
+
+        index = VectorIndex(current)
+        old_ids = [str(cid) for cid in index.chunk_ids]
+        keep = np.array([cid in live_ids for cid in old_ids], dtype=bool)
+        new_ids = sorted(live_ids - set(old_ids))
+        if keep.all() and not new_ids:
+            print(f"[로컬 벡터 인덱스] '{domain}' 변경 없음")
+            continue
+
+        ids = [cid for cid, k in zip(old_ids, keep) if k]
+        docs = [str(d) for d, k in zip(index.doc_ids, keep) if k]
+        vecs = [index.dense(np.flatnonzero(keep))]
+        for i in range(0, len(new_ids), 500):
+            res = await es.mget(index=INDEX_CHUNK, ids=new_ids[i:i + 500], _source=["doc_id", VECTOR_FIELD])
+            found = [d for d in res["docs"] if d.get("found") and d["_source"].get(VECTOR_FIELD) is not None]
+            ids.extend(d["_id"] for d in found)
+            docs.extend(d["_source"].get("doc_id", "") for d in found)
+            if found:
+                vecs.append(np.array([d["_source"][VECTOR_FIELD] for d in found], dtype=np.float32))
+
+        write_index(path, ids, docs, np.concatenate(vecs), dtype or index.meta["dtype"], centroids=index.centroids)
+        print(f"[로컬 벡터 인덱스] '{domain}' 갱신 완료 (+{len(new_ids)} / -{int((~keep).sum())})")
+
+
+async def _main(args):
+    from .es_client import close_es
+    try:
+        if args.command == "build":
+            await build(args.dtype or VECTOR_INDEX_DTYPE, args.nlist)
+        else:
+            await refresh(args.dtype)
+    finally:
+        await close_es()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="minsa_data 로컬 벡터 인덱스 생성/갱신")
+    parser.add_argument("command", choices=["build", "refresh"])
+    parser.add_argument("--dtype", choices=["float32", "int8"], default=None,
+                        help=f"build 기본: {VECTOR_INDEX_DTYPE}, refresh 기본: 기존 인덱스의 dtype")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 리스트 수 (기본: 4*sqrt(N))")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,37 @@
+# 기동 시 백그라운드 워밍업 및 readiness 판정
+# 무거운 리소스(문장 인코더, ES 커넥션)는 import 시점이 아니라 lifespan/첫 사용 시점에 만든다.
+import asyncio
+from config import ENCODER_WARMUP
+from .model_loader import get_model, is_model_loaded
+from .es_client import get_es
+
+READY_PING_TIMEOUT = 1.0
+
+
+async def warm_up():
+    """모델 로드 + 더미 encode 로 첫 요청의 지연을 없앤다."""
+    try:
+        model = await asyncio.to_thread(get_model)
+        await asyncio.to_thread(model.encode, "워밍업")
+        print("[WARMUP] 문장 인코더 준비 완료")
+    except Exception as e:
+        print(f"[WARMUP] 문장 인코더 워밍업 실패 : {type(e).__name__} - {e}")
+
+    try:
+        await get_es().options(request_timeout=READY_PING_TIMEOUT).ping()
+    except Exception as e:
+        print(f"[WARMUP] Elasticsearch 연결 실패 : {type(e).__name__} - {e}")
+
+
+async def readiness():
+    """로드밸런서용 준비 상태. 워밍업을 끈 경우 인코더는 첫 사용 시 로드되므로 조건에서 제외한다."""
+    try:
+        es_ready = bool(await get_es().options(request_timeout=READY_PING_TIMEOUT).ping())
+    except Exception:
+        es_ready = False
+    encoder_ready = is_model_loaded()
+    return {
+        "ready": es_ready and (encoder_ready or not ENCODER_WARMUP),
+        "encoder": encoder_ready,
+        "elasticsearch": es_ready,
+    }
@@ -0,0 +1,245 @@
+# services/admission.py 슬롯 / conv lock 반납 확인 (거절 경로, 연결 끊김 경로)
+import asyncio
+import anyio
+import pytest
+from models.models import ChatRequest
+from services.admission import AdmissionController, AdmissionRejected
+from services.memory_manager import MemoryManager
+from services.session_store import SqliteSessionStore
+from services.sse_writer import sse_event
+import services.history_manager as history_manager
+import routers.chat_pipeline as chat_pipeline
+
+
+def controller(**kwargs):
+    options = dict(max_inflight=1, queue_size=1, queue_timeout=0.1, mode_limits={"advising": 1}, conv_timeout=0.1)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def assert_idle(ctl):
+    assert ctl.inflight == 0
+    assert ctl.waiting == 0
+    assert ctl.slots._value == ctl.max_inflight
+    assert all(slots._value == 1 for slots in ctl.mode_slots.values())
+    assert all(count == 0 for count in ctl.mode_inflight.values())
+    assert ctl.conv_locks == {}
+
+
+def test_release_is_idempotent():
+    async def main():
+        ctl = controller()
+        ticket = await ctl.admit("a")
+        await ctl.admit_mode(ticket, "advising")
+        ticket.release()
+        ticket.release()
+        assert_idle(ctl)
+
+    asyncio.run(main())
+
+
+def test_queue_full_and_queue_timeout():
+    async def main():
+        ctl = controller()
+        holder = await ctl.admit("a")
+        waiter = asyncio.ensure_future(ctl.admit("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.admit("c")
+        assert (e.value.status, e.value.reason) == (429, "queue_full")
+        with pytest.raises(AdmissionRejected) as e:
+            await waiter
+        assert (e.value.status, e.value.reason) == (503, "queue_timeout")
+        holder.release()
+        assert_idle(ctl)
+        assert ctl.shed["queue_full"] == 1 and ctl.shed["queue_timeout"] == 1
+
+    asyncio.run(main())
+
+
+def test_conv_busy():
+    async def main():
+        ctl = controller(max_inflight=2)
+        holder = await ctl.admit("a")
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.admit("a")
+        assert (e.value.status, e.value.reason) == (429, "conv_busy")
+        assert ctl.inflight == 1
+        holder.release()
+        assert_idle(ctl)
+
+    asyncio.run(main())
+
+
+def test_cancelled_while_queued():
+    async def main():
+        ctl = controller(queue_timeout=5)
+        holder = await ctl.admit("a")
+        waiter = asyncio.ensure_future(ctl.admit("b"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        holder.release()
+        assert_idle(ctl)
+
+    asyncio.run(main())
+
+
+def test_mode_timeout():
+    async def main():
+        ctl = controller(max_inflight=2)
+        holder = await ctl.admit("a")
+        await ctl.admit_mode(holder, "advising")
+        ticket = await ctl.admit("b")
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.admit_mode(ticket, "advising")
+        assert (e.value.status, e.value.reason) == (503, "mode_timeout")
+        ticket.release()
+        holder.release()
+        assert_idle(ctl)
+
+    asyncio.run(main())
+
+
+def test_admit_mode_on_released_ticket_returns_slot():
+    async def main():
+        ctl = controller(max_inflight=2, queue_timeout=5)
+        holder = await ctl.admit("a")
+        await ctl.admit_mode(holder, "advising")
+        ticket = await ctl.admit("b")
+        waiter = asyncio.ensure_future(ctl.admit_mode(ticket, "advising"))
+        await asyncio.sleep(0.01)
+        ticket.release()
+        holder.release()
+        await waiter
+        assert ticket.mode is None
+        assert_idle(ctl)
+
+    asyncio.run(main())
+
+
+def test_abandon_before_stream_start_releases():
+    async def main():
+        ctl = controller()
+        ticket = await ctl.admit("a")
+        await ctl.admit_mode(ticket, "advising")
+        ticket.abandon()  # 핸들러 실행 중: 표시만
+        assert not ticket.released and ctl.inflight == 1
+        ticket.handed_off = True
+        ticket.abandon()  # 응답을 넘겼지만 스트림 시작 전: 반납
+        assert ticket.released
+        assert_idle(ctl)
+
+    asyncio.run(main())
+
+
+class FakeRequest:
+    def __init__(self):
+        self.gone = False
+
+    async def is_disconnected(self):
+        return self.gone
+
+
+def test_disconnect_during_admit_mode(monkeypatch):
+    ctl = controller(max_inflight=4, queue_size=4, queue_timeout=5)
+    monkeypatch.setattr(chat_pipeline, "admission", ctl)
+    monkeypatch.setattr(history_manager, "count_tokens", len)
+    conv_idx = "disconnect-admit-mode"
+    chat_pipeline.memory.add(conv_idx, "user", "임대인이 보증금을 돌려주지 않습니다")
+    chat_pipeline.memory.set_mode(conv_idx, "advising")
+
+    async def main():
+        holder = await ctl.admit("other")
+        await ctl.admit_mode(holder, "advising")
+
+        http_request = FakeRequest()
+        task = asyncio.ensure_future(chat_pipeline.chat_pipeline(
+            ChatRequest(query="판례를 알려주세요", domain="부동산", conv_idx=conv_idx), http_request))
+        await asyncio.sleep(0.05)
+        assert ctl.waiting == 0 and ctl.inflight == 1  # 모드 슬롯을 기다리는 동안 전체 슬롯은 내놓음
+
+        http_request.gone = True
+        await asyncio.sleep(0.4)  # DISCONNECT_POLL_MS 이상
+        # 핸들러가 아직 모드 슬롯을 기다리는 동안 conv lock 은 유지
+        assert not task.done()
+        assert ctl.inflight == 1 and conv_idx in ctl.conv_locks
+
+        holder.release()
+        response = await task
+        assert response.status_code == 499
+        assert_idle(ctl)
+        assert ctl.mode_slots["advising"]._value == 1
+
+    asyncio.run(main())
+
+
+def test_stream_cancelled_mid_flight_releases_ticket(monkeypatch, tmp_path):
+    ctl = controller(max_inflight=2)
+    memory = MemoryManager(store=SqliteSessionStore(str(tmp_path / "sessions.db")))
+    monkeypatch.setattr(chat_pipeline, "admission", ctl)
+    monkeypatch.setattr(chat_pipeline, "memory", memory)
+    monkeypatch.setattr(history_manager, "count_tokens", len)
+
+    async def stalled_agent(query, domain, history):
+        yield sse_event({"token": "임대차"})
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(chat_pipeline, "guidance_agent", stalled_agent)
+    conv_idx = "cancel-mid-stream"
+    memory.add(conv_idx, "user", "전세 계약 절차를 알려주세요")
+    memory.set_mode(conv_idx, "guidance")
+
+    async def main():
+        response = await chat_pipeline.chat_pipeline(
+            ChatRequest(query="등기부등본은 어디서 떼나요", domain="부동산", conv_idx=conv_idx), FakeRequest())
+        chunks = []
+
+        async def consume():
+            async for chunk in response.body_iterator:
+                chunks.append(chunk)
+
+        # Starlette 가 연결 끊김으로 스트림을 취소하는 것과 같은 anyio cancel scope
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(consume)
+            await asyncio.sleep(0.05)
+            tg.cancel_scope.cancel()
+        await asyncio.sleep(0.1)  # 저장 task 가 sqlite 저장을 마칠 때까지
+
+        assert len(chunks) == 2
+        assert_idle(ctl)
+        assert await memory.store.version(conv_idx) == 1
+        await memory.close()
+
+    asyncio.run(main())
+
+
+def test_mode_waiters_do_not_hold_global_slots():
+    async def main():
+        ctl = controller(max_inflight=3, queue_size=3, queue_timeout=0.5)
+        holder = await ctl.admit("a")
+        await ctl.admit_mode(holder, "advising")
+        waiters = []
+        for conv_idx in ("b", "c"):
+            ticket = await ctl.admit(conv_idx)
+            waiters.append((ticket, asyncio.ensure_future(ctl.admit_mode(ticket, "advising"))))
+        await asyncio.sleep(0.01)
+        assert ctl.inflight == 1
+
+        # advising 대기가 전체 슬롯을 잡고 있지 않으므로 free_chat 은 바로 수락
+        ticket = await asyncio.wait_for(ctl.admit("d"), 0.05)
+        await ctl.admit_mode(ticket, "free_chat")
+        assert ctl.inflight == 2
+        ticket.release()
+
+        holder.release()
+        first, second = waiters
+        await first[1]
+        assert first[0].mode == "advising" and ctl.inflight == 1
+        first[0].release()
+        await second[1]
+        second[0].release()
+        assert_idle(ctl)
+
+    asyncio.run(main())
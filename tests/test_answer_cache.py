@@ -0,0 +1,20 @@
+# services/answer_cache.py TTL 정리
+import numpy as np
+from services.answer_cache import AnswerCache
+
+
+def test_lookup_purges_expired_entries(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("services.answer_cache.time.monotonic", lambda: now[0])
+    cache = AnswerCache(threshold=0.9, max_entries=10, ttl=10)
+    cache.store("민사", "보증금 반환", np.array([1.0, 0.0]), "답변1")
+    cache.store("민사", "계약 해지", np.array([0.0, 1.0]), "답변2")
+    now[0] = 5
+    cache.store("민사", "임대료 연체", np.array([0.7, 0.7]), "답변3")
+
+    now[0] = 12
+    # 가장 가까운 항목이 아니어도 만료된 항목은 모두 정리
+    answer, similarity = cache.lookup("민사", np.array([0.7, 0.7]))
+    assert answer == "답변3" and similarity > 0.99
+    assert len(cache.entries) == 1 and cache.counts["expired"] == 2
+    assert cache.domains["민사"]["matrix"].shape == (1, 2)
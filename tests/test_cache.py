@@ -0,0 +1,120 @@
+# services/cache.py LRUCache / SqliteCache / SingleFlight
+import asyncio
+import pytest
+from services.cache import LRUCache, SqliteCache, SingleFlight
+
+
+def test_lru_evicts_oldest_and_expires(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("services.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(max_entries=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 를 최근 사용으로
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.evictions == 1
+    now[0] = 11
+    assert cache.get("a") is None and cache.expirations == 1
+
+
+def test_sqlite_cache_prunes_least_recently_used(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("services.cache.time.time", lambda: now[0])
+    monkeypatch.setattr(SqliteCache, "PRUNE_EVERY", 4)
+    cache = SqliteCache(str(tmp_path / "cache.db"), ttl=100, max_entries=2)
+    for key in ("a", "b", "c"):
+        now[0] += 1
+        cache.set(key, key.encode())
+    assert cache.stats()["size"] == 3  # 정리 전에는 max_entries 를 넘을 수 있음
+    now[0] += 1
+    assert cache.get("a") == b"a"  # a 를 최근 사용으로
+    now[0] += 1
+    cache.set("d", b"d")  # 네 번째 저장 → 정리
+    assert cache.stats()["size"] == 2
+    assert cache.get("a") == b"a" and cache.get("d") == b"d"
+    assert cache.get("b") is None and cache.get("c") is None
+
+
+def test_singleflight_coalesces_and_shares_result():
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+        assert results == ["result"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"leaders": 1, "coalesced": 4, "inflight": 0}
+
+    asyncio.run(main())
+
+
+def test_singleflight_leader_error_reaches_followers_and_is_not_kept():
+    async def main():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert flight.stats()["inflight"] == 0
+
+        async def ok():
+            return "ok"
+
+        # 실패한 작업은 남지 않으므로 다음 호출은 새로 실행
+        assert await flight.do("k", ok) == "ok"
+        assert flight.leaders == 2
+
+    asyncio.run(main())
+
+
+def test_singleflight_cancelling_one_waiter_keeps_shared_work():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("k", work))
+        follower = asyncio.ensure_future(flight.do("k", work))
+        await started.wait()
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == "done"
+
+    asyncio.run(main())
+
+
+def test_singleflight_cancelling_all_waiters_cancels_work():
+    async def main():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flight.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.stats()["inflight"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+# services/disconnect.py 스트림 취소 경로 (Starlette 가 폴링보다 먼저 스트림을 취소하는 경우)
+import asyncio
+import anyio
+from services.disconnect import DisconnectGuard, disconnect_stats
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_cancel_while_awaiting_next_chunk():
+    closed = []
+
+    async def agent():
+        try:
+            yield "data: {\"token\": \"판례\"}\n\n"
+            await asyncio.sleep(10)
+            yield "data: [DONE]\n\n"
+        finally:
+            await asyncio.sleep(0)  # 정리 중에도 await 가 있는 generator
+            closed.append(True)
+
+    async def main():
+        guard = DisconnectGuard(FakeRequest(), "cancel-next", poll_ms=10_000)
+        chunks, errors = [], []
+        before = disconnect_stats["disconnects"]
+
+        async def consume():
+            try:
+                async for chunk in guard.stream(agent(), "free_chat"):
+                    chunks.append(chunk)
+            except BaseException as e:
+                errors.append(e)
+                raise
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(consume)
+            await asyncio.sleep(0.05)
+            tg.cancel_scope.cancel()
+        guard.close()
+
+        assert len(chunks) == 1
+        assert [type(e) for e in errors] == [asyncio.CancelledError]
+        assert closed == [True]
+        assert guard.disconnected
+        assert disconnect_stats["disconnects"] == before + 1
+        assert disconnect_stats["stages"]["free_chat"] >= 1
+
+    asyncio.run(main())
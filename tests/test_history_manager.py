@@ -0,0 +1,52 @@
+# services/history_manager.py 백그라운드 요약과 공유 저장소 동기화
+import asyncio
+import services.history_manager as history_manager
+from services.memory_manager import MemoryManager
+
+
+def test_summary_is_dropped_when_session_was_rebased(monkeypatch):
+    monkeypatch.setattr(history_manager, "count_tokens", len)
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def fake_completion(**kwargs):
+            await gate.wait()
+            return "요약"
+
+        monkeypatch.setattr(history_manager, "chat_completion", fake_completion)
+        manager = MemoryManager(store=None)
+        for i in range(4):
+            manager.add("c", "user" if i % 2 == 0 else "ai", f"메시지 {i} " * 10)
+        session = manager.ensure_session("c")
+        history_manager.schedule_summary(session, budget=40)
+        await asyncio.sleep(0)
+        assert session.summarizing
+
+        # 요약 도중 다른 워커의 상태로 교체 (end_turn 충돌 병합)
+        state = manager._snapshot(session)
+        state["messages"] = [["human", "다른 워커의 메시지"]] + state["messages"]
+        manager._apply_state("c", session, state, 2)
+        gate.set()
+        await asyncio.gather(*history_manager._tasks)
+
+        assert session.summary == "" and session.summarized == 0
+        assert not session.summarizing
+
+        # 교체가 없으면 반영
+        history_manager.schedule_summary(session, budget=40)
+        await asyncio.gather(*history_manager._tasks)
+        assert session.summary == "요약" and session.summarized > 0
+
+    asyncio.run(main())
+
+
+def test_count_tokens_falls_back_when_encoding_fails(monkeypatch):
+    def fail(name):
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(history_manager, "_encoding", None)
+    monkeypatch.setattr(history_manager.tiktoken, "get_encoding", fail)
+    history_manager.load_encoding()
+    assert history_manager._encoding is None
+    assert history_manager.count_tokens("보증금 반환") == len("보증금 반환")
@@ -0,0 +1,135 @@
+# services/memory_manager.py 공유 저장소 동기화 (version 충돌 병합, 턴 도중 eviction)
+import asyncio
+import services.session_store as session_store
+from services.memory_manager import MemoryManager
+from services.session_store import InMemorySessionStore, SqliteSessionStore
+
+
+def messages(manager, conv_idx):
+    return [(m.type, m.content) for m in manager.get_memory(conv_idx).chat_memory.messages]
+
+
+def test_end_turn_conflict_rebases_onto_latest_state():
+    async def main():
+        store = InMemorySessionStore()
+        a, b = MemoryManager(store=store), MemoryManager(store=store)
+
+        await a.begin_turn("c")
+        a.add("c", "user", "질문1")
+        a.add("c", "ai", "답변1")
+        await a.end_turn("c")
+
+        # 두 워커가 같은 version 에서 동시에 턴을 시작
+        turn_a = await a.begin_turn("c")
+        turn_b = await b.begin_turn("c")
+        assert messages(b, "c") == messages(a, "c")
+        b.add("c", "user", "질문2-b")
+        b.set_mode("c", "info_gathering")
+        await b.end_turn("c", turn_b)
+        a.add("c", "user", "질문2-a")
+        a.set_mode("c", "advising")
+        await a.end_turn("c", turn_a)
+
+        state, version = await store.load("c")
+        assert version == 3
+        assert [c for _, c in state["messages"]] == ["질문1", "답변1", "질문2-b", "질문2-a"]
+        assert state["mode"] == "advising"  # 나중에 끝난 턴의 결정
+        assert messages(a, "c") == [tuple(m) for m in state["messages"]]
+        assert turn_a.base_len is None and turn_a.version == 3
+
+    asyncio.run(main())
+
+
+def test_restore_mid_turn_is_not_merged_twice():
+    async def main():
+        store = InMemorySessionStore()
+        a, b = MemoryManager(store=store), MemoryManager(store=store)
+        records = [{"question": "질문1", "answer": "답변1"}]
+
+        # 두 워커가 모두 빈 세션에서 턴을 시작해 DB 기록을 복원
+        turn_a = await a.begin_turn("c")
+        turn_b = await b.begin_turn("c")
+        a.restore("c", records)
+        b.restore("c", records)
+        b.add("c", "user", "질문2-b")
+        await b.end_turn("c", turn_b)
+        a.add("c", "user", "질문2-a")
+        await a.end_turn("c", turn_a)
+
+        state, version = await store.load("c")
+        assert version == 2
+        assert [c for _, c in state["messages"]] == ["질문1", "답변1", "질문2-b", "질문2-a"]
+
+    asyncio.run(main())
+
+
+def test_session_evicted_mid_turn_is_still_saved():
+    async def main():
+        store = InMemorySessionStore()
+        manager = MemoryManager(max_sessions=1, store=store)
+        turn = await manager.begin_turn("a")
+        manager.add("a", "user", "질문")
+        manager.ensure_session("b")  # max_sessions=1 → a 가 밀려남
+        assert "a" not in manager.sessions
+        manager.set_mode("a", "advising")  # 같은 세션 객체를 되살려 변경
+        assert manager.sessions["a"] is turn
+        await manager.end_turn("a", turn)
+
+        state, version = await store.load("a")
+        assert version == 1 and state["mode"] == "advising"
+        assert state["messages"] == [["human", "질문"]]
+
+    asyncio.run(main())
+
+
+def test_expired_session_is_saved_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+
+    async def main():
+        store = InMemorySessionStore(ttl=10)
+        manager = MemoryManager(store=store)
+        await manager.begin_turn("a")
+        manager.add("a", "user", "질문")
+        await manager.end_turn("a")
+        now[0] += 11
+        assert await store.load("a") == (None, 0)
+
+        # 로컬 세션은 version 1 이지만 저장소에서는 만료됨 → 새 세션으로 저장
+        await manager.begin_turn("a")
+        manager.add("a", "user", "질문2")
+        await manager.end_turn("a")
+        state, version = await store.load("a")
+        assert version == 1 and len(state["messages"]) == 2
+
+    asyncio.run(main())
+
+
+def test_sqlite_store_expires_and_sweeps(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+
+    async def main():
+        store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl=10)
+        state = {"messages": [], "mode": "free_chat", "info_rounds": 0, "summary": "", "summarized": 0}
+        assert await store.save("a", state, 0)
+        assert not await store.save("a", state, 0)
+        assert await store.version("a") == 1
+
+        now[0] += 11
+        assert await store.version("a") == 0
+        assert not await store.save("a", state, 1)  # 만료된 version 으로는 되살리지 않음
+        assert await store.save("a", state, 0)
+        assert await store.version("a") == 1
+
+        await store.delete("a")
+        assert await store.load("a") == (None, 0)
+
+        await store.save("b", state, 0)
+        now[0] += session_store.SWEEP_INTERVAL + 11
+        await store.save("c", state, 0)  # 정리 주기가 지나 만료된 b 를 삭제
+        rows = store._conn.execute("SELECT conv_idx FROM sessions").fetchall()
+        assert rows == [("c",)]
+        await store.close()
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# services/resilience.py 서킷 브레이커 상태 전이 / 마감 시간과 실패 집계
+import asyncio
+import pytest
+import services.resilience as resilience
+from services.resilience import CircuitBreaker, CircuitOpen, deadline, es_call
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, reset=60)
+    for _ in range(2):
+        breaker.allow()
+        breaker.failure()
+    breaker.allow()
+    breaker.success()  # 성공하면 연속 실패 수 초기화
+    for _ in range(3):
+        breaker.allow()
+        breaker.failure()
+    assert breaker.state == "open" and breaker.opens == 1
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_breaker_half_open_allows_single_trial(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failures=1, reset=30)
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+    now[0] += 31
+    breaker.allow()  # 시험 요청
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()  # 시험 요청이 끝나기 전에는 나머지 거절
+
+    breaker.failure()  # 시험 실패 → 다시 open
+    assert breaker.state == "open" and breaker.opens == 2
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    now[0] += 31
+    breaker.allow()
+    breaker.abandon()  # 결과 없이 끝난 시험 요청은 다음 요청이 다시 시험
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.allow()
+
+
+def slow_request(timeout):
+    async def request():
+        await asyncio.sleep(10)
+    return request()
+
+
+def test_deadline_truncated_timeout_is_not_a_failure(monkeypatch):
+    breaker = CircuitBreaker(failures=1, reset=60)
+    monkeypatch.setattr(resilience, "es_breaker", breaker)
+    monkeypatch.setattr(resilience, "ES_HEDGE", False)
+
+    async def main():
+        with deadline(0.05):
+            with pytest.raises(asyncio.TimeoutError):
+                await es_call("test", slow_request, cap=5)
+        assert breaker.state == "closed" and breaker.failures == 0
+
+        with pytest.raises(asyncio.TimeoutError):
+            await es_call("test", slow_request, cap=0.05)
+        assert breaker.state == "open"
+
+    asyncio.run(main())
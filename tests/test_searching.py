@@ -0,0 +1,40 @@
+# services/searching.py hybrid_search 결과 캐시
+import asyncio
+import services.searching as searching
+from services.cache import LRUCache, SingleFlight
+from services.resilience import degrade
+
+
+def run_search(monkeypatch, fake):
+    monkeypatch.setattr(searching, "_retrieval_cache", LRUCache(10))
+    monkeypatch.setattr(searching, "_retrieval_flight", SingleFlight())
+    monkeypatch.setattr(searching, "_hybrid_search", fake)
+    return asyncio.run(searching.hybrid_search("보증금 반환", "부동산"))
+
+
+def test_vectors_are_dropped_before_caching(monkeypatch):
+    async def fake(query, mapped_domain, k):
+        return [({"doc_id": "d1", "text": "t", searching.VECTOR_FIELD: [0.1] * 768}, 0.9)]
+
+    results = run_search(monkeypatch, fake)
+    assert results == [({"doc_id": "d1", "text": "t"}, 0.9)]
+    assert len(searching._retrieval_cache) == 1
+    cached = searching._retrieval_cache.get(("보증금 반환", "부동산/임대차", 5))
+    assert searching.VECTOR_FIELD not in cached[0][0]
+
+
+def test_empty_results_are_not_cached(monkeypatch):
+    async def fake(query, mapped_domain, k):
+        return []
+
+    assert run_search(monkeypatch, fake) == []
+    assert len(searching._retrieval_cache) == 0
+
+
+def test_degraded_results_are_not_cached(monkeypatch):
+    async def fake(query, mapped_domain, k):
+        degrade("fallback_search")
+        return [({"doc_id": "d1", "text": "t"}, 0.5)]
+
+    assert len(run_search(monkeypatch, fake)) == 1
+    assert len(searching._retrieval_cache) == 0
@@ -0,0 +1,37 @@
+# services/sse_writer.py ms 정책 flush (services/chat_agent.py stream_response)
+import asyncio
+import functools
+import time
+import services.chat_agent as chat_agent
+from services.sse_writer import TokenWriter
+
+
+class StallingChain:
+    async def astream(self, inputs):
+        yield "민법"
+        yield " 제"
+        await asyncio.sleep(0.3)  # 상류 지연
+        yield "618조"
+
+
+def test_ms_policy_flushes_pending_tokens_during_stall(monkeypatch):
+    monkeypatch.setattr(chat_agent, "TokenWriter", functools.partial(TokenWriter, policy="ms", interval_ms=30))
+
+    async def main():
+        start = time.monotonic()
+        frames = []
+        async for frame in chat_agent.stream_response(StallingChain(), {}, model="test-model"):
+            frames.append((round(time.monotonic() - start, 2), frame))
+        return frames
+
+    frames = asyncio.run(main())
+    tokens = [(t, f) for t, f in frames if f.startswith('data: {"token"')]
+    assert [f for _, f in tokens] == [
+        'data: {"token": "민법"}\n\n',
+        'data: {"token": " 제"}\n\n',
+        'data: {"token": "618조"}\n\n',
+    ]
+    # 두 번째 토큰은 지연이 끝날 때가 아니라 flush 간격 안에 전송
+    assert tokens[1][0] < 0.2
+    assert frames[-2][1] == 'data: {"full": "민법 제618조"}\n\n'
+    assert frames[-1][1] == "data: [DONE]\n\n"